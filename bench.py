@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks every method in Simulator.methods over a range of grid sizes and
+time steps, for the potentials of potentials.py.
+
+    python bench.py --output before.json
+    python bench.py --output after.json
+    python bench.py --compare before.json after.json
+
+For every combination it reports steps/s, the peak memory allocated while
+stepping, and the energy and norm drift per unit of simulated time. The
+results are written as json, so runs on different commits can be compared.
+
+    python bench.py --stencils
+
+compares the accuracy and cost of the Laplacian stencils instead: a fast
+free wavepacket is propagated on grids of increasing N and compared with
+the exact solution, so the N that each stencil order needs for a given
+error can be read off.
+"""
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import headless
+from potentials import registry as potential_registry
+from simulator import Simulator, laplacian_stencils
+
+default_sizes = [256, 1024, 4096]
+default_dts = [1e-3, 5e-3]
+default_stencil_orders = [2, 4, 6, 8, "spectral"]
+default_stencil_sizes = [128, 256, 512, 1024, 2048]
+
+
+def benchmark(method, potential, N, dt, steps, settings):
+    """
+    Runs one benchmark and returns a dict with the results.
+    """
+    config = dict(headless.default_config)
+    config.update(settings)
+    config.update(N=N, dt=dt, method=method, potential={"name": potential})
+
+    with np.errstate(all="ignore"):
+        sim = headless.make_simulator(config)
+        # the first step builds cached operators and compiles kernels
+        sim.run(1, observables=(), snapshots=False)
+        energy0, norm0, t0 = sim.energy(), sim.norm(), sim.t
+        sim._last_norm = None
+
+        start = time.perf_counter()
+        sim.run(steps, observables=(), snapshots=False)
+        elapsed = time.perf_counter() - start
+
+        energy1, norm1 = sim.energy(), sim.norm()
+        duration = sim.t - t0
+        energy_drift = np.max(np.abs(energy1 - energy0)) / max(
+            np.max(np.abs(energy0)), 1e-300
+        )
+        if sim._last_norm is not None:
+            # the method normalizes every step, so use the norm error of a
+            # single step before normalizing
+            norm_drift = np.max(np.abs(sim._last_norm - 1)) * steps
+        else:
+            norm_drift = np.max(np.abs(norm1 - norm0))
+
+        # memory is measured separately because tracing slows things down
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        sim.run(min(steps, 10), observables=(), snapshots=False)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+    return dict(
+        method=method,
+        potential=potential,
+        N=N,
+        dt=dt,
+        precision=sim.precision,
+        steps=steps,
+        steps_per_second=steps / elapsed,
+        peak_memory_bytes=int(peak),
+        energy_drift_per_time=float(energy_drift / duration),
+        norm_drift_per_time=float(norm_drift / duration),
+    )
+
+
+def free_wavepacket(x, t, sigma, momentum, m, hbar, L):
+    """
+    The exact solution for the "wavepacket" of wavefunctions.py without a
+    potential, at time t, normalized. The packet is assumed to be narrow
+    compared to L, so only the nearest periodic image is kept.
+    """
+    k = 2 * np.pi * momentum
+    alpha = 1 + 1j * hbar * t / (m * sigma**2)
+    shifted = (x - hbar * k * t / m + L / 2) % L - L / 2
+    psi = np.exp(-(shifted**2) / (2 * sigma**2 * alpha)) / np.sqrt(alpha)
+    psi = psi * np.exp(1j * k * x - 1j * hbar * k**2 * t / (2 * m))
+    dx = x[1] - x[0]
+    return psi / np.sqrt(np.sum(np.abs(psi) ** 2) * dx)
+
+
+def stencil_accuracy(order, N, duration, settings, sigma=0.05, momentum=20):
+    """
+    Propagates a free wavepacket with re_im_leapfrog and the Laplacian of
+    the given order, and returns a dict with the error relative to the exact
+    solution and the time it took. dt is kept below the stability limit of
+    the stencil.
+    """
+    config = dict(headless.default_config)
+    config.update(settings)
+    config.update(
+        N=N,
+        stencil_order=order,
+        method="re_im_leapfrog",
+        potential={"name": "zero potential"},
+        wavefunction=dict(
+            name="wavepacket", sigma=sigma, momentum=momentum, mu=0
+        ),
+    )
+    m, hbar, L = config["m"], config["hbar"], config["L"]
+    dx = L / N
+    if order == "spectral":
+        largest_symbol = np.pi**2
+    else:
+        # the Laplacian is most negative for the shortest wavelength 2 dx
+        c = laplacian_stencils[order]
+        largest_symbol = -c[0] - 2 * sum(
+            c_k * (-1) ** k for k, c_k in enumerate(c[1:], 1)
+        )
+    max_energy = hbar**2 / (2 * m * dx**2) * largest_symbol
+    steps = int(np.ceil(duration / min(1e-4, 0.8 * hbar / max_energy)))
+    config["dt"] = duration / steps
+
+    sim = headless.make_simulator(config)
+    # the numba kernels only exist for order 2, compare like with like
+    sim.backend = "numpy"
+
+    def exact(t):
+        # re_im_leapfrog keeps the imaginary part half a step ahead of the
+        # real part. Starting from a state at a single time adds an error of
+        # O(dt) that would hide the error of the stencil.
+        real = free_wavepacket(sim.x, t, sigma, momentum, m, hbar, L)
+        imag = free_wavepacket(
+            sim.x, t + sim.dt / 2, sigma, momentum, m, hbar, L
+        )
+        return real.real + 1j * imag.imag
+
+    sim.set_psi(exact(0.0))
+    start = time.perf_counter()
+    sim.run(steps, observables=(), snapshots=False)
+    elapsed = time.perf_counter() - start
+
+    error = np.sqrt(np.sum(np.abs(sim.psi - exact(sim.t)) ** 2) * sim.dx)
+    return dict(
+        stencil_order=order,
+        N=N,
+        dt=config["dt"],
+        steps=steps,
+        error=float(error),
+        seconds=elapsed,
+    )
+
+
+def run_stencils(orders, sizes, duration, settings):
+    results = []
+    for order, N in itertools.product(orders, sizes):
+        result = stencil_accuracy(order, N, duration, settings)
+        results.append(result)
+        print(
+            f"order={str(order):9s} N={N:<6d} dt={result['dt']:<8.1e} "
+            f"error={result['error']:.2e} {result['seconds']:8.3f} s"
+        )
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return dict(
+        commit=commit,
+        date=time.strftime("%Y-%m-%d %H:%M:%S"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+    )
+
+
+def run_all(methods, potentials, sizes, dts, steps, settings):
+    results = []
+    combinations = itertools.product(methods, potentials, sizes, dts)
+    for method, potential, N, dt in combinations:
+        if method == "spectral" and potential_registry.time_dependent(
+            potential
+        ):
+            # the eigenbasis of a time dependent potential changes
+            continue
+        result = benchmark(method, potential, N, dt, steps, settings)
+        results.append(result)
+        print(
+            f"{method:26s} {potential:26s} N={N:<6d} dt={dt:<8.1e} "
+            f"{result['steps_per_second']:10.0f} steps/s "
+            f"{result['peak_memory_bytes'] / 1e6:8.2f} MB "
+            f"dE/T={result['energy_drift_per_time']:.2e} "
+            f"dnorm/T={result['norm_drift_per_time']:.2e}"
+        )
+    return results
+
+
+def compare(old_path, new_path, threshold=0.1):
+    """
+    Prints the change in steps/s between two result files and returns the
+    number of benchmarks that got slower by more than threshold.
+    """
+
+    def load(path):
+        with open(path) as stream:
+            data = json.load(stream)
+        results = {
+            (r["method"], r["potential"], r["N"], r["dt"]): r
+            for r in data["results"]
+        }
+        return data["meta"]["commit"] or path, results
+
+    old_name, old = load(old_path)
+    new_name, new = load(new_path)
+    print(f"{old_name} -> {new_name}")
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]["steps_per_second"] / old[key]["steps_per_second"]
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "  SLOWER"
+            regressions += 1
+        method, potential, N, dt = key
+        print(
+            f"{method:26s} {potential:26s} N={N:<6d} dt={dt:<8.1e} "
+            f"{ratio:6.2f}x{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--methods", nargs="+", default=Simulator.methods)
+    parser.add_argument(
+        "--potentials", nargs="+", default=potential_registry.names
+    )
+    parser.add_argument("--N", nargs="+", type=int)
+    parser.add_argument("--dt", nargs="+", type=float, default=default_dts)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument(
+        "--precision", choices=("double", "single"), default="double"
+    )
+    parser.add_argument(
+        "--settings",
+        default="settings.yaml",
+        help="yaml file with m, hbar, L and potential_inf_at",
+    )
+    parser.add_argument("--output", help="json file for the results")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="compare two result files instead of running",
+    )
+    parser.add_argument(
+        "--stencils",
+        nargs="*",
+        metavar="ORDER",
+        help="report the error and cost of the Laplacian stencils instead, "
+        f"for the given orders (default {default_stencil_orders}) and the "
+        f"sizes in --N (default {default_stencil_sizes})",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=1.0,
+        help="simulated time of the --stencils runs",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+
+    settings = {
+        key: value
+        for key, value in headless.load_config(args.settings).items()
+        if key in ("m", "hbar", "L", "potential_inf_at")
+    }
+    settings["precision"] = args.precision
+    if args.stencils is not None:
+        orders = [
+            order if order == "spectral" else int(order)
+            for order in args.stencils or default_stencil_orders
+        ]
+        sizes = args.N or default_stencil_sizes
+        results = run_stencils(orders, sizes, args.duration, settings)
+    else:
+        sizes = args.N or default_sizes
+        results = run_all(
+            args.methods, args.potentials, sizes, args.dt, args.steps, settings
+        )
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(dict(meta=metadata(), results=results), stream, indent=1)
+
+
+if __name__ == "__main__":
+    main()
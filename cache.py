@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+A least recently used cache with a memory budget, for evaluated potentials,
+initial states and the operators Simulator derives from them.
+
+    cache = LRUCache(max_bytes=2**26)
+    value = cache.get(key, build)  # calls build() only on a miss
+
+When the values together take more than max_bytes, the least recently used
+ones are dropped. The size of a value is estimated with sizeof.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+
+def sizeof(value, _seen=None):
+    """
+    Estimated memory in bytes held by value: the data of NumPy arrays and
+    sparse matrices or LU factorizations, summed over tuples, lists, dicts
+    and the variables a function closes over. Other objects count as 0.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, "nnz"):
+        # a value and an index per stored element
+        return int(value.nnz) * 24
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(item, _seen) for item in value)
+    if isinstance(value, dict):
+        return sum(sizeof(item, _seen) for item in value.values())
+    closure = getattr(value, "__closure__", None)
+    if closure:
+        return sum(sizeof(cell.cell_contents, _seen) for cell in closure)
+    return 0
+
+
+class LRUCache:
+    def __init__(self, max_bytes=2**28, max_entries=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        # key -> (value, size in bytes), least recently used first
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """
+        The value cached for key, or the result of build() which is then
+        cached.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = build()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        nbytes = sizeof(value)
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        self._evict()
+
+    def _evict(self):
+        # the newest entry is always kept, even if it alone is too large
+        while len(self._entries) > 1 and (
+            self.nbytes > self.max_bytes
+            or (
+                self.max_entries is not None
+                and len(self._entries) > self.max_entries
+            )
+        ):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
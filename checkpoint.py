@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Saves the state of a Simulator to a single .npz file and restores it, so a
+long run can be paused, moved to another machine or continued after a
+crash.
+
+    save_checkpoint(sim, "run.npz")
+    sim = load_checkpoint("run.npz")
+
+The file holds psi (in the precision of the simulation), the static
+potential, the probability absorbed so far and the dt history as arrays,
+and the grid (N, L), hbar, m, method, dt, t, step_count and the other
+settings as json in the "meta" entry. It is written to a temporary file
+that is renamed when complete, so a crash while saving never leaves a
+broken checkpoint behind.
+
+The modulation of a time dependent potential is a Python function and is
+not stored, only its shape. Pass it to load_checkpoint, or load into a
+Simulator that was set up with the same drive, e.g. by headless.py.
+
+Checkpointer saves a checkpoint every n steps and keeps only the newest
+ones.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+
+from simulator import Simulator
+
+format_version = 1
+
+
+def save_checkpoint(sim, path, compress=False):
+    """
+    Writes the state of sim to path. compress=True makes the file smaller
+    for states with large empty regions, at the cost of a slower save.
+    """
+    meta = dict(
+        version=format_version,
+        N=sim.N,
+        L=sim.L,
+        hbar=sim.hbar,
+        m=sim.m,
+        dt=sim.dt,
+        method=sim.method,
+        t=sim.t,
+        step_count=sim.step_count,
+        potential_inf_at=sim.potential_inf_at,
+        precision="auto" if sim.upcast_on_drift else sim.precision,
+        drift_tolerance=sim.drift_tolerance,
+        stencil_order=sim.stencil_order,
+        krylov_dim=sim.krylov_dim,
+        krylov_tolerance=sim.krylov_tolerance,
+        absorber=sim.absorber,
+        backend=sim.backend,
+        workspace=sim.workspace,
+        n_eigenstates=sim.n_eigenstates,
+        active_threshold=sim.active_threshold,
+        active_margin=sim.active_margin,
+    )
+    arrays = dict(
+        # NumPy scalars, e.g. a dt set by run_adaptive, as Python numbers
+        meta=np.array(json.dumps(meta, default=lambda value: value.item())),
+        psi=sim.psi,
+        potential=sim.potential,
+        absorbed=sim.absorbed,
+        dt_history=np.array(sim.dt_history, dtype=float).reshape(-1, 2),
+    )
+    if sim.drive is not None:
+        arrays["drive_shape"] = sim.drive[0]
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as stream:
+        (np.savez_compressed if compress else np.savez)(stream, **arrays)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path, sim=None, modulation=None):
+    """
+    Restores the checkpoint at path into sim, which must have the same grid,
+    or into a new Simulator if sim is None, and returns it. If the
+    checkpoint has a drive, its modulation is taken from the modulation
+    argument or else from the drive of sim.
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta["version"] > format_version:
+            raise ValueError(
+                f"{path} has checkpoint version {meta['version']}, this "
+                f"version reads up to {format_version}"
+            )
+        arrays = {name: data[name] for name in data.files if name != "meta"}
+
+    if sim is None:
+        sim = Simulator(
+            N=meta["N"],
+            L=meta["L"],
+            workspace=meta["workspace"],
+            backend=meta["backend"],
+            n_eigenstates=meta["n_eigenstates"],
+            active_threshold=meta["active_threshold"],
+            active_margin=meta["active_margin"],
+        )
+    elif (sim.N, sim.L) != (meta["N"], meta["L"]):
+        raise ValueError(
+            f"{path} is for N={meta['N']}, L={meta['L']}, not N={sim.N}, "
+            f"L={sim.L}"
+        )
+
+    if "drive_shape" in arrays:
+        if modulation is None:
+            if sim.drive is None:
+                raise ValueError(
+                    f"{path} has a time dependent potential, pass its "
+                    f"modulation"
+                )
+            modulation = sim.drive[1]
+    sim.hbar = meta["hbar"]
+    sim.m = meta["m"]
+    sim.dt = meta["dt"]
+    sim.method = meta["method"]
+    sim.potential_inf_at = meta["potential_inf_at"]
+    sim.precision = meta["precision"]
+    sim.drift_tolerance = meta["drift_tolerance"]
+    sim.stencil_order = meta["stencil_order"]
+    sim.krylov_dim = meta.get("krylov_dim", sim.krylov_dim)
+    sim.krylov_tolerance = meta.get("krylov_tolerance", sim.krylov_tolerance)
+    if meta["absorber"] is None:
+        sim.set_absorber()
+    else:
+        sim.set_absorber(*meta["absorber"])
+    sim.potential = arrays["potential"]
+    sim.set_drive(arrays.get("drive_shape"), modulation)
+
+    sim.set_psi(arrays["psi"], normalize=False)
+    sim.absorbed = arrays["absorbed"]
+    sim.t = meta["t"]
+    sim.step_count = meta["step_count"]
+    sim.dt_history = [tuple(row) for row in arrays["dt_history"]]
+    return sim
+
+
+def _checkpoint_step(path):
+    name = os.path.basename(path)
+    return int(name[len("checkpoint_") : -len(".npz")])
+
+
+def list_checkpoints(directory):
+    """
+    The checkpoints written by Checkpointer in directory, oldest first.
+    """
+    paths = glob.glob(os.path.join(directory, "checkpoint_*.npz"))
+    return sorted(paths, key=_checkpoint_step)
+
+
+def latest_checkpoint(directory):
+    """
+    The newest checkpoint in directory, or None if there is none.
+    """
+    paths = list_checkpoints(directory)
+    return paths[-1] if paths else None
+
+
+class Checkpointer:
+    """
+    Saves a checkpoint of the simulator to directory whenever at least
+    `every` steps were taken since the last one, as
+    checkpoint_<step_count>.npz. Only the newest `keep` checkpoints are
+    kept, of the ones saved by this Checkpointer and the paths in previous,
+    e.g. the checkpoints of the run that is resumed. Other files in
+    directory are left alone. last_step is the step of the last checkpoint,
+    e.g. the one a run was resumed from.
+    """
+
+    def __init__(
+        self,
+        directory,
+        every,
+        keep=3,
+        compress=False,
+        last_step=0,
+        previous=(),
+    ):
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        self.compress = compress
+        self.last_step = last_step
+        # the checkpoints that may be removed, oldest first
+        self.saved = sorted(previous, key=_checkpoint_step)
+        os.makedirs(directory, exist_ok=True)
+
+    def due(self, sim):
+        return sim.step_count - self.last_step >= self.every
+
+    def save(self, sim):
+        """
+        Saves a checkpoint now, removes the oldest ones beyond keep and
+        returns the path.
+        """
+        path = os.path.join(
+            self.directory, f"checkpoint_{sim.step_count:09d}.npz"
+        )
+        save_checkpoint(sim, path, compress=self.compress)
+        self.last_step = sim.step_count
+        if path in self.saved:
+            self.saved.remove(path)
+        self.saved.append(path)
+        while len(self.saved) > self.keep:
+            old = self.saved.pop(0)
+            if os.path.exists(old):
+                os.remove(old)
+        return path
+
+    def record(self, sim):
+        """
+        Saves a checkpoint if one is due and returns its path, else None.
+        """
+        if self.due(sim):
+            return self.save(sim)
+        return None
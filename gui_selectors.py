@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Widgets to pick a potential or initial wavefunction and set its parameters.
+They are generated from the registries in potentials.py and wavefunctions.py:
+every registered name is an item of the dropdown and every parameter gets a
+spin box with the range, step and default value from param_control_settings.
+"""
+import sys
+
+from PyQt6.QtWidgets import (
+    QApplication,
+    QWidget,
+    QHBoxLayout,
+    QVBoxLayout,
+    QLabel,
+    QComboBox,
+    QDoubleSpinBox,
+    QSpinBox,
+)
+
+import potentials
+import wavefunctions
+
+
+class Selector(QWidget):
+    # set by the subclasses
+    registry = None
+    title = ""
+
+    def __init__(self):
+        super().__init__()
+
+        self.layout = QVBoxLayout()
+
+        self.params = dict()
+        self.name = None
+
+        self.selector = QComboBox()
+        self.selector.addItems(self.registry.names)
+        self.selector.currentTextChanged.connect(self.pick)
+
+        self.controls_layout = QHBoxLayout()
+        self.layout.addWidget(QLabel(self.title))
+        self.layout.addWidget(self.selector)
+        self.layout.addLayout(self.controls_layout)
+        self.setLayout(self.layout)
+
+        self.pick(self.registry.names[0])
+
+    def pick(self, text):
+
+        self.params = dict()
+        self.name = text
+
+        # delete old controls
+        layout = self.controls_layout
+        old_widgets = [
+            layout.itemAt(i).widget() for i in range(layout.count())
+        ]
+        for old_widget in old_widgets:
+            layout.removeWidget(old_widget)
+            old_widget.deleteLater()
+            old_widget = None
+
+        for param in self.registry.params(text):
+            self.init_param_controls(param)
+
+    def save_param(self, param):
+        def _save_param(value):
+            self.params[param] = value
+
+        return _save_param
+
+    def init_param_controls(self, param):
+        sets = self.registry.settings[param]
+        # integer settings, such as the quantum number n, get a QSpinBox
+        if all(isinstance(value, int) for value in sets.values()):
+            control = QSpinBox()
+        else:
+            control = QDoubleSpinBox()
+
+        control.valueChanged.connect(self.save_param(param))
+        control.setMinimum(sets["min"])
+        control.setMaximum(sets["max"])
+        control.setSingleStep(sets["step"])
+        control.setValue(sets["value"])
+        control.valueChanged.emit(control.value())
+
+        self.controls_layout.addWidget(QLabel(param))
+        self.controls_layout.addWidget(control)
+
+    def get(self, x):
+        return self.registry.evaluate(self.name, x, **self.params)
+
+    def get_parts(self, x):
+        """
+        (static, shape, modulation), see Registry.parts.
+        """
+        return self.registry.parts(self.name, x, **self.params)
+
+
+class PotentialSelector(Selector):
+    registry = potentials.registry
+    title = "Potential"
+    names = potentials.names
+
+    def pick_potential(self, text):
+        self.pick(text)
+
+    def get_potential(self, x):
+        return self.get(x)
+
+
+class WavefunctionSelector(Selector):
+    registry = wavefunctions.registry
+    title = "Initial wavefunction"
+    names = wavefunctions.names
+
+    def pick_wavefunction(self, text):
+        self.pick(text)
+
+    def get_wavefunction(self, x):
+        return self.get(x)
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    window = QWidget()
+    layout = QVBoxLayout()
+    layout.addWidget(WavefunctionSelector())
+    layout.addWidget(PotentialSelector())
+    window.setLayout(layout)
+    window.show()
+    sys.exit(app.exec())
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a simulation without the GUI and streams the results to disk.
+
+    python headless.py run config.yaml
+
+The config file uses the same keys as settings.yaml (dt, N, m,
+potential_inf_at) and can add:
+
+    L: 1
+    hbar: 1.0
+    method: re_im_leapfrog
+    potential:
+      name: harmonic oscillator
+      k: 50
+    wavefunction:
+      name: wavepacket
+      sigma: 0.1
+      momentum: 10
+    absorber:
+      width: 0.1
+      strength: 10
+      kind: cap
+    active_threshold: 1.0e-8
+    stencil_order: 4
+    precision: single
+    krylov_tolerance: 1.0e-8
+    steps: 10000
+    observe_every: 100
+    checkpoint_every: 5000
+    checkpoint_keep: 3
+    output: output
+
+Potentials and wavefunctions are picked by the names used in the GUI, any
+parameter that is not given gets the default from param_control_settings.
+Time dependent potentials, such as "driven harmonic oscillator", are
+simulated with Simulator.set_drive. The optional absorber adds absorbing
+layers at the edges of the grid (see Simulator.set_absorber), the absorbed
+probability is then written to observables.csv as well. With
+active_threshold the stencil methods only update the region where psi is
+not negligible (see Simulator.active_window). stencil_order picks the
+finite difference Laplacian, 2, 4, 6, 8 or spectral. precision is double,
+single or auto (single, switching to double when the energy drifts, see
+Simulator.precision); the snapshots are stored in the same precision.
+krylov_dim and krylov_tolerance set the subspace of the lanczos methods.
+Every observe_every steps a snapshot of psi is added to the output directory,
+which is a recording (see recorder.py) that can be replayed in the GUI, and a
+line is added to observables.csv.
+
+With checkpoint_every, a checkpoint (see checkpoint.py) is saved to
+output/checkpoints at the first observation after every checkpoint_every
+steps, and only the newest checkpoint_keep are kept. Checkpoints of an
+earlier run in output are removed when a new run starts. A run that was
+stopped continues from the newest one with
+
+    python headless.py run config.yaml --resume
+
+or from a given checkpoint with --resume path/to/checkpoint.npz. The
+recording and observables.csv are continued from the checkpoint as well.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import yaml
+
+import potentials
+import wavefunctions
+from checkpoint import (
+    Checkpointer,
+    _checkpoint_step,
+    latest_checkpoint,
+    list_checkpoints,
+    load_checkpoint,
+)
+from recorder import TrajectoryRecorder
+from simulator import Simulator
+
+default_config = dict(
+    dt=0.5e-2,
+    N=200,
+    L=1,
+    m=1000,
+    hbar=1.0,
+    potential_inf_at=10000,
+    method="re_im_leapfrog",
+    potential={"name": "zero potential"},
+    wavefunction={"name": "wavepacket"},
+    absorber=None,
+    active_threshold=None,
+    stencil_order=2,
+    precision="double",
+    krylov_dim=30,
+    krylov_tolerance=1e-10,
+    steps=1000,
+    observe_every=100,
+    checkpoint_every=None,
+    checkpoint_keep=3,
+    output="output",
+)
+
+observables = ("energy", "norm")
+
+
+def load_config(path):
+    config = dict(default_config)
+    with open(path) as stream:
+        config.update(yaml.safe_load(stream) or {})
+    return config
+
+
+def _parse(spec):
+    """
+    The name and parameters of spec, a name or a dict with the name and
+    parameters.
+    """
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    spec = dict(spec)
+    name = spec.pop("name")
+    return name, spec
+
+
+def make_potential(spec, x, t=0.0):
+    name, params = _parse(spec)
+    return potentials.registry.evaluate(name, x, t, **params)
+
+
+def make_wavefunction(spec, x):
+    name, params = _parse(spec)
+    return wavefunctions.registry.evaluate(name, x, **params)
+
+
+def make_simulator(config):
+    sim = Simulator(
+        N=config["N"],
+        L=config["L"],
+        hbar=config["hbar"],
+        m=config["m"],
+        dt=config["dt"],
+        method=config["method"],
+        potential_inf_at=config["potential_inf_at"],
+        workspace=True,
+        backend="auto",
+        active_threshold=config["active_threshold"],
+        stencil_order=config["stencil_order"],
+        precision=config["precision"],
+        krylov_dim=config["krylov_dim"],
+        krylov_tolerance=config["krylov_tolerance"],
+    )
+    name, params = _parse(config["potential"])
+    potential, shape, modulation = potentials.registry.parts(
+        name, sim.x, **params
+    )
+    sim.potential = potential
+    sim.set_drive(shape, modulation)
+    if config["absorber"]:
+        sim.set_absorber(**config["absorber"])
+    sim.set_psi(make_wavefunction(config["wavefunction"], sim.x))
+    return sim
+
+
+def _truncate_csv(path, step):
+    """
+    Removes the rows of observables.csv after the given step.
+    """
+    with open(path) as stream:
+        lines = stream.readlines()
+    keep = lines[:1] + [
+        line for line in lines[1:] if int(line.split(",")[0]) <= step
+    ]
+    with open(path, "w") as stream:
+        stream.writelines(keep)
+
+
+def run(config, resume=None):
+    """
+    Runs the simulation of config. resume is the path of a checkpoint to
+    continue from, or "latest" for the newest one in the output directory.
+    """
+    sim = make_simulator(config)
+    steps = config["steps"]
+    observe_every = config["observe_every"] or steps
+    output = config["output"]
+    checkpoints = os.path.join(output, "checkpoints")
+    columns = observables
+    if sim.absorber is not None:
+        columns += ("absorbed_probability",)
+    csv_path = os.path.join(output, "observables.csv")
+
+    if resume == "latest":
+        resume = latest_checkpoint(checkpoints)
+        if resume is None:
+            raise FileNotFoundError(f"No checkpoints in {checkpoints}")
+    if resume:
+        load_checkpoint(resume, sim)
+        recorder = TrajectoryRecorder.resume(output, sim.step_count)
+        _truncate_csv(csv_path, sim.step_count)
+        previous = []
+        for path in list_checkpoints(checkpoints):
+            if _checkpoint_step(path) > sim.step_count:
+                # ahead of the resumed run, like the rows of the csv
+                os.remove(path)
+            else:
+                previous.append(path)
+        print(f"Resuming from {resume} at step {sim.step_count}")
+    else:
+        # the checkpoints of an earlier run in output would be resumed from
+        for path in list_checkpoints(checkpoints):
+            os.remove(path)
+        previous = []
+        recorder = TrajectoryRecorder.for_simulator(output, sim)
+        with open(os.path.join(output, "config.yaml"), "w") as stream:
+            yaml.safe_dump(config, stream)
+        with open(csv_path, "w") as csv:
+            csv.write(",".join(("step", "t") + columns) + "\n")
+
+    checkpointer = None
+    if config["checkpoint_every"]:
+        checkpointer = Checkpointer(
+            checkpoints,
+            config["checkpoint_every"],
+            keep=config["checkpoint_keep"],
+            last_step=sim.step_count,
+            previous=previous,
+        )
+
+    with recorder, open(csv_path, "a") as csv:
+
+        def write(results):
+            recorder.record(sim)
+            row = [results["step"][-1], results["t"][-1]]
+            row += [results[name][-1] for name in columns]
+            # ensemble members get one column each, separated by spaces
+            csv.write(
+                ",".join(" ".join(map(str, np.ravel(v))) for v in row) + "\n"
+            )
+            csv.flush()
+            if checkpointer is not None and checkpointer.due(sim):
+                # the recording must be on disk up to the checkpoint
+                recorder.flush()
+                checkpointer.save(sim)
+
+        if not resume:
+            write(sim.run(0, observables=columns, snapshots=False))
+        start = time.perf_counter()
+        start_step = sim.step_count
+        while sim.step_count < steps:
+            n = min(observe_every, steps - sim.step_count)
+            write(sim.run(n, observables=columns, snapshots=False))
+        elapsed = time.perf_counter() - start
+
+    done = sim.step_count - start_step
+    print(
+        f"{done} steps in {elapsed:.2f} s "
+        f"({done / max(elapsed, 1e-12):.0f} steps/s), output in {output}"
+    )
+    return sim
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run a simulation")
+    run_parser.add_argument("config", help="yaml file, e.g. settings.yaml")
+    run_parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="latest",
+        metavar="CHECKPOINT",
+        help="continue from a checkpoint, by default the newest one",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run(load_config(args.config), resume=args.resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+JIT compiled kernels for the explicit methods of Simulator.
+
+Every kernel fuses the stencil and the update into a single pass over the
+grid, parallelized over the grid points. They need numba. When it is not
+installed numba_available is False and Simulator uses its NumPy code instead.
+All kernels work on 2D arrays of shape (B, N), a single wavefunction is
+passed as B = 1.
+
+Importing numba takes a while, so it only happens when a kernel is first
+used.
+"""
+import importlib.util
+
+import numpy as np
+
+numba_available = importlib.util.find_spec("numba") is not None
+
+# (_stencil_update, _stencil_step), see _compile
+_kernels = None
+
+
+def _compile():
+    """
+    Imports numba and defines the kernels on the first call.
+    """
+    global _kernels
+    if _kernels is not None:
+        return _kernels
+
+    import numba
+
+    @numba.njit(parallel=True, cache=True)
+    def _stencil_update(dst, src, off, diagonal, coefficient):
+        """
+        dst += coefficient * H src, where H src = off * (src[i-1] + src[i+1])
+        + diagonal[i] * src[i] with periodic boundaries.
+        """
+        B, N = src.shape
+        n_diagonals = diagonal.shape[0]
+        for b in range(B):
+            d = diagonal[b % n_diagonals]
+            for i in numba.prange(N):
+                left = src[b, i - 1] if i > 0 else src[b, N - 1]
+                right = src[b, i + 1] if i < N - 1 else src[b, 0]
+                H_src = off * (left + right) + d[i] * src[b, i]
+                dst[b, i] += coefficient * H_src
+
+    @numba.njit(parallel=True, cache=True)
+    def _stencil_step(out, src, off, diagonal, coefficient):
+        """
+        out = src + coefficient * H src. out must not overlap with src.
+        """
+        B, N = src.shape
+        n_diagonals = diagonal.shape[0]
+        for b in range(B):
+            d = diagonal[b % n_diagonals]
+            for i in numba.prange(N):
+                left = src[b, i - 1] if i > 0 else src[b, N - 1]
+                right = src[b, i + 1] if i < N - 1 else src[b, 0]
+                H_src = off * (left + right) + d[i] * src[b, i]
+                out[b, i] = src[b, i] + coefficient * H_src
+
+    _kernels = _stencil_update, _stencil_step
+    return _kernels
+
+
+def _as_2d(array):
+    return array.reshape(-1, array.shape[-1])
+
+
+def leapfrog(psi, off, diagonal, dt):
+    """
+    One re_im_leapfrog step, updating the complex array psi in place.
+    """
+    stencil_update, _ = _compile()
+    psi = _as_2d(psi)
+    # scalars of the same precision as psi, so float32 stays float32
+    real = psi.real.dtype.type
+    diagonal = _as_2d(np.asarray(diagonal, dtype=psi.real.dtype))
+    off, dt = real(off), real(dt)
+    R, I = psi.real, psi.imag
+    stencil_update(R, I, off, diagonal, dt)
+    stencil_update(I, R, off, diagonal, -dt)
+
+
+def explicit_step(out, psi, off, diagonal, coefficient):
+    """
+    Writes psi + coefficient * H psi into out. This is forward_euler for
+    coefficient = -1j * dt and find_ground_state for coefficient = -dt.
+    """
+    _, stencil_step = _compile()
+    diagonal = _as_2d(np.asarray(diagonal, dtype=psi.real.dtype))
+    off, coefficient = psi.real.dtype.type(off), psi.dtype.type(coefficient)
+    stencil_step(_as_2d(out), _as_2d(psi), off, diagonal, coefficient)
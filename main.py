@@ -20,14 +20,19 @@ from PyQt6.QtWidgets import (
     QSizePolicy,
     QDoubleSpinBox,
     QCheckBox,
+    QFileDialog,
 )
 from PyQt6.QtCore import QSize, QTimer, Qt
 import yaml
 
-from wavefunctions import WavefunctionSelector
-from potentials import PotentialSelector
+from gui_selectors import WavefunctionSelector, PotentialSelector
 
-from simulator import Simulator
+from simulator import Simulator, laplacian_stencils
+from recorder import TrajectoryReader
+from worker import SimulationWorker
+from observables import Observables
+from profiling import PhaseTimer
+from plotting import PlotBuffer
 
 # sys.exit()
 
@@ -75,7 +80,20 @@ class MainWindow(QMainWindow):
             m=settings["m"],
             method="re_im_leapfrog",
             potential_inf_at=settings["potential_inf_at"],
+            workspace=True,
+            backend="auto",
+            precision=settings.get("precision", "double"),
         )
+        # energy, norm etc. every 10 steps, without extra Hamiltonian
+        # applications where the method allows it
+        observables = Observables(self.sim, every=10)
+        # Times the step, energy, plot2d and plot3d phases when enabled with
+        # the "Profile" checkbox.
+        self.profiler = PhaseTimer()
+        observables.timer = self.profiler
+        # The physics runs in this thread, the timer only renders the newest
+        # state it published.
+        self.worker = SimulationWorker(self.sim, timer=self.profiler)
 
         self.gl_plot.setMinimumWidth(200)
 
@@ -101,6 +119,14 @@ class MainWindow(QMainWindow):
             self.method_dropdown.currentText()
         )
 
+        self.stencil_dropdown = QComboBox()
+        self.stencil_dropdown.addItems(
+            [str(order) for order in laplacian_stencils] + ["spectral"]
+        )
+        self.stencil_dropdown.currentTextChanged.connect(
+            self.set_stencil_order
+        )
+
         self.reim_scale = 1.0
         self.reim_scale_slider = QSlider(Qt.Orientation.Horizontal)
         self.init_param_controls(
@@ -111,9 +137,18 @@ class MainWindow(QMainWindow):
         self.init_plot3d(self.sim.x, self.sim.psi)
 
         self.energylabel = QLabel("")
+        self.profile_label = QLabel("")
+        self.profile_label.hide()
         self.params_label = QLabel("")
         self.update_params_label()
 
+        # relative energy drift since the last reset
+        self.drift_plot = pg.PlotWidget()
+        self.drift_plot.setMaximumHeight(150)
+        self.drift_plot.setMouseEnabled(x=False, y=False)
+        self.drift_plot.getAxis("left").setLabel("energy drift")
+        self.drift_line = self.drift_plot.plot([], [])
+
         self.plot_toggle_layout = QHBoxLayout()
         self.plot3d_toggle = QCheckBox()
         self.plot3d_toggle.stateChanged.connect(self.toggle_plot3d)
@@ -130,6 +165,38 @@ class MainWindow(QMainWindow):
             self.plot_toggle_layout, self.plot2d_toggle, "2D plot"
         )
 
+        # absorbing layers at the edges, so wavepackets leave the grid
+        # instead of wrapping around
+        self.absorber_toggle = QCheckBox()
+        self.absorber_toggle.stateChanged.connect(self.toggle_absorber)
+        self.add_with_label(
+            self.plot_toggle_layout, self.absorber_toggle, "Absorbing edges"
+        )
+
+        self.profile_layout = QHBoxLayout()
+        self.profile_toggle = QCheckBox()
+        self.profile_toggle.stateChanged.connect(self.toggle_profiling)
+        self.dump_profile_button = QPushButton("Dump timings")
+        self.dump_profile_button.clicked.connect(self.dump_profile)
+        self.add_with_label(
+            self.profile_layout, self.profile_toggle, "Profile"
+        )
+        self.profile_layout.addWidget(self.dump_profile_button)
+
+        # replay of recordings made with recorder.py, e.g. by headless.py
+        self.replay = None
+        self.replay_layout = QHBoxLayout()
+        self.open_recording_button = QPushButton("Open recording")
+        self.open_recording_button.clicked.connect(self.open_recording)
+        self.live_button = QPushButton("Live")
+        self.live_button.clicked.connect(self.reset)
+        self.live_button.hide()
+        self.replay_layout.addWidget(self.open_recording_button)
+        self.replay_layout.addWidget(self.live_button)
+        self.replay_slider = QSlider(Qt.Orientation.Horizontal)
+        self.replay_slider.valueChanged.connect(self.show_replay_frame)
+        self.replay_slider.hide()
+
         self.wavefunction_selector = WavefunctionSelector()
         self.potential_selector = PotentialSelector()
 
@@ -142,6 +209,12 @@ class MainWindow(QMainWindow):
             stretch=1,
             alignment=align_top,
         )
+        self.add_with_label(
+            sidebar_layout,
+            self.stencil_dropdown,
+            "Stencil order",
+            alignment=align_top,
+        )
         self.add_with_label(sidebar_layout, self.reim_scale_slider, "Scale")
         sidebar_layout.addWidget(
             self.wavefunction_selector, 0, alignment=align_top
@@ -150,9 +223,14 @@ class MainWindow(QMainWindow):
             self.potential_selector, 0, alignment=align_top
         )
         sidebar_layout.addWidget(self.energylabel, 0, alignment=align_top)
+        sidebar_layout.addWidget(self.profile_label, 0, alignment=align_top)
         sidebar_layout.addWidget(self.params_label, 0, alignment=align_top)
+        sidebar_layout.addWidget(self.drift_plot, 0, alignment=align_top)
 
         sidebar_layout.addLayout(self.plot_toggle_layout)
+        sidebar_layout.addLayout(self.profile_layout)
+        sidebar_layout.addLayout(self.replay_layout)
+        sidebar_layout.addWidget(self.replay_slider)
 
         sidebar_layout.addStretch()
         sidebar_layout.setSpacing(10)
@@ -172,6 +250,7 @@ class MainWindow(QMainWindow):
         QTimer.singleShot(0, self.start_simulation)
 
     def start_simulation(self):
+        self.worker.start()
         self.reset()
         self.set_play_state(True)
 
@@ -216,9 +295,13 @@ class MainWindow(QMainWindow):
 
     def set_play_state(self, play):
         if play:
+            if self.replay is None:
+                # a replay only advances the slider, see loop
+                self.worker.play()
             self.timer.start()
             self.play_button.setText("Pause")
         else:
+            self.worker.pause()
             self.timer.stop()
             self.play_button.setText("Play")
 
@@ -227,9 +310,14 @@ class MainWindow(QMainWindow):
 
     def set_method(self, method):
 
-        self.timer.stop()
-        self.sim.method = method
-        self.timer.start()
+        with self.worker.lock:
+            self.sim.method = method
+
+    def set_stencil_order(self, order):
+        with self.worker.lock:
+            self.sim.stencil_order = (
+                order if order == "spectral" else int(order)
+            )
 
     def toggle_plot3d(self, enable):
         self.plot3d_enabled = enable
@@ -245,50 +333,151 @@ class MainWindow(QMainWindow):
         else:
             self.plot2d.hide()
 
+    def toggle_absorber(self, enable):
+        width = 0.1 * self.sim.L if enable else 0.0
+        with self.worker.lock:
+            self.sim.set_absorber(width)
+
+    def toggle_profiling(self, enable):
+        self.profiler.enabled = bool(enable)
+        self.profiler.clear()
+        if enable:
+            self.profile_label.show()
+        else:
+            self.profile_label.hide()
+
+    def dump_profile(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Dump timings", "timings.json", "JSON (*.json)"
+        )
+        if path:
+            self.profiler.dump(path)
+
     def update_params_label(self):
         self.params_label.setText(
             f"m={self.sim.m:.0f}  hbar={self.sim.hbar:.1f}  dt={self.sim.dt:.1e}"
         )
 
+    def open_recording(self):
+        path = QFileDialog.getExistingDirectory(self, "Open recording")
+        if not path:
+            return
+        try:
+            self.replay = TrajectoryReader(path)
+        except OSError as exc:
+            print(f"Error: could not open recording {path}: {exc}")
+            return
+        # the recording is read from disk, nothing has to be simulated
+        self.worker.pause()
+
+        self.potential_line.setData(self.replay.x, self.replay.potential)
+        self.replay_slider.setMaximum(max(len(self.replay) - 1, 0))
+        self.replay_slider.setValue(0)
+        self.replay_slider.show()
+        self.live_button.show()
+        self.show_replay_frame(0)
+
+    def show_replay_frame(self, frame):
+        if self.replay is None or len(self.replay) == 0:
+            return
+        psi = self.replay[frame]
+        if psi.ndim > 1:
+            # only the first member of a recorded ensemble is shown
+            psi = psi[0]
+        t = self.replay.t[frame]
+        self.energylabel.setText(f"Replay t={t:.4g} ({frame})")
+        if self.plot3d_enabled:
+            self.update_plot3d(self.replay.x, psi)
+        if self.plot2d_enabled:
+            self.update_plot2d(self.replay.x, psi)
+
     def reset(self):
 
-        timer_running = self.timer.isActive()
-        if timer_running:
-            self.timer.stop()
+        if self.replay is not None:
+            # back to the live simulation
+            self.replay = None
+            self.replay_slider.hide()
+            self.live_button.hide()
+            if self.play_button.isChecked():
+                self.worker.play()
 
         x = self.sim.x
         wavefunction = self.wavefunction_selector.get_wavefunction(x)
-        self.sim.psi = wavefunction
+        potential, shape, modulation = self.potential_selector.get_parts(x)
 
-        potential = self.potential_selector.get_potential(x)
-        self.sim.potential = potential
+        with self.worker.lock:
+            self.sim.set_psi(wavefunction)
+            self.sim.potential = potential
+            # the time dependent part, if any
+            self.sim.set_drive(shape, modulation)
+            self.sim.observables.clear()
+        # show the new state right away, also when paused
+        self.worker.publish()
 
-        self.potential_line.setData(x, potential)
+        self.potential_line.setData(x, self.sim.potential_at(0.0))
 
         self.update_params_label()
 
-        if timer_running:
-            self.timer.start()
-        else:
-            # this gets executed when the simulation is paused and reset is
-            # pressed
-            self.loop(0)
-
-    def loop(self, physics_steps=10):
-        for i in range(physics_steps):
-            self.sim.step()
-        energy = (
-            np.vdot(
-                self.sim.psi,
-                self.sim.hamiltonian(self.sim.psi),
-            ).real
-            * self.sim.dx
-        )
-        self.energylabel.setText(f"Energy {energy:.6f}")
-        if self.plot3d_enabled:
-            self.update_plot3d()
-        if self.plot2d_enabled:
-            self.update_plot2d()
+        self.loop()
+
+    def loop(self):
+        if self.replay is not None:
+            # playing a recording, advancing the slider shows the next frame
+            if len(self.replay) > 0:
+                frame = (self.replay_slider.value() + 1) % len(self.replay)
+                self.replay_slider.setValue(frame)
+            return
+
+        if self.worker.error is not None:
+            # the worker paused itself, e.g. for a method that does not
+            # support the potential
+            self.energylabel.setText(f"Stopped: {self.worker.error}")
+            self.play_button.setChecked(False)
+            self.set_play_state(False)
+            return
+
+        with self.worker.frame() as frame:
+            if frame.psi is None:
+                return
+            psi = frame.psi
+            if psi.ndim > 1:
+                # only the first member of an ensemble is shown
+                psi = psi[0]
+            text = (
+                f"Energy {frame.energy:.6f}\n"
+                f"{frame.steps_per_second:.0f} steps/s"
+            )
+            if self.sim.absorber is not None:
+                absorbed = np.ravel(self.sim.absorbed)[0]
+                text += f"\nAbsorbed {absorbed:.4f}"
+            self.energylabel.setText(text)
+            if self.plot3d_enabled:
+                with self.profiler.phase("plot3d"):
+                    self.update_plot3d(self.sim.x, psi)
+            if self.plot2d_enabled:
+                with self.profiler.phase("plot2d"):
+                    self.update_plot2d(self.sim.x, psi)
+            if frame.history is not None:
+                self.update_drift_plot(frame.history)
+            if self.sim.drive is not None:
+                self.potential_line.setData(
+                    self.sim.x, self.sim.potential_at(frame.t)
+                )
+        if self.profiler.enabled:
+            self.profile_label.setText(self.profiler.summary())
+
+    def update_drift_plot(self, history):
+        energy = history["energy"]
+        if energy.ndim > 1:
+            energy = energy[:, 0]
+        if len(energy) == 0:
+            return
+        drift = (energy - energy[0]) / max(abs(energy[0]), 1e-300)
+        self.drift_line.setData(history["t"], drift)
+
+    def closeEvent(self, event):
+        self.worker.stop()
+        super().closeEvent(event)
 
     def init_plot2d(self, x, psi, potential):
         # self.plot = pg.PlotWi
@@ -300,6 +489,11 @@ class MainWindow(QMainWindow):
 
         ######
 
+        # x, re, im and abs of psi, decimated to the width of the plot
+        self.plot2d_buffer = PlotBuffer()
+        # abs(psi) at every grid point, input of the decimation
+        self.abs_psi = np.empty(0)
+
         self.plot2d = pg.PlotWidget()
         self.plot2d.setMouseEnabled(x=False, y=True)
         self.plot2d.setYRange(-5, 5)
@@ -336,13 +530,21 @@ class MainWindow(QMainWindow):
         # Call it once manually to align views at the start
         update_views()
 
-    def update_plot2d(self):
-        x = self.sim.x
-        psi = self.sim.psi
-        self.psi_2d_abs.setData(x, np.abs(psi))
-        self.psi_2d_re.setData(x, np.real(psi))
+    def update_plot2d(self, x=None, psi=None):
+        if x is None:
+            x, psi = self.sim.x, self.sim.psi
+        if self.abs_psi.shape != psi.shape:
+            self.abs_psi = np.empty(psi.shape)
+        np.abs(psi, out=self.abs_psi)
+        x, re, im, abs_psi = self.plot2d_buffer.update(
+            x,
+            (psi.real, psi.imag, self.abs_psi),
+            self.pixel_width(self.plot2d),
+        )
+        self.psi_2d_abs.setData(x, abs_psi)
+        self.psi_2d_re.setData(x, re)
         # self.psi_2d_re.setData(x, np.real(self.sim.kinetic))
-        self.psi_2d_im.setData(x, np.imag(psi))
+        self.psi_2d_im.setData(x, im)
         # self.psi_2d_im.setData(x, np.real(self.sim.psi))
 
     def init_plot3d(self, x, psi):
@@ -353,7 +555,12 @@ class MainWindow(QMainWindow):
         grid.setSpacing(x=0.5, y=0.5, z=0.5)
         self.gl_plot.addItem(grid)
 
-        pts = np.array([x, np.real(psi), np.imag(psi)]).T
+        # vertices (x, re, im) of the line, decimated to the width of the
+        # view
+        self.plot3d_buffer = PlotBuffer(np.float32, interleaved=True)
+        pts = self.plot3d_buffer.update(
+            x, (psi.real, psi.imag), self.pixel_width(self.gl_plot)
+        )
 
         # Create a line plot item and add it
         self.line_plot = gl.GLLinePlotItem(
@@ -365,18 +572,26 @@ class MainWindow(QMainWindow):
         self.gl_plot.setCameraPosition(distance=1.5)
         self.gl_plot.orbit(azim=240, elev=0)
 
-    def update_plot3d(self):
+    def update_plot3d(self, x=None, psi=None):
+        if x is None:
+            x, psi = self.sim.x, self.sim.psi
 
-        psi = self.sim.psi
-        pts = np.array(
-            [
-                self.sim.x,
-                np.real(psi) * self.reim_scale,
-                np.imag(psi) * self.reim_scale,
-            ]
-        ).T
+        pts = self.plot3d_buffer.update(
+            x,
+            (psi.real, psi.imag),
+            self.pixel_width(self.gl_plot),
+            scale=self.reim_scale,
+        )
         self.line_plot.setData(pos=pts)
 
+    @staticmethod
+    def pixel_width(widget):
+        """
+        Width of widget in device pixels, the number of buckets for the
+        min/max decimation of the plotted curves.
+        """
+        return max(int(widget.width() * widget.devicePixelRatioF()), 1)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
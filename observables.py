@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Keeps a history of expectation values of a Simulator.
+
+    observables = Observables(sim, every=10)
+    sim.run(1000)
+    history = observables.history()  # dict of arrays, oldest first
+
+Once attached, the simulator updates it after every step. Every `every`
+steps it stores the energy, norm, <x>, <p> and the width of the
+wavefunction in a fixed size ring buffer. When the method can get the
+energy from its own intermediate results (see Simulator.track_energy), no
+extra Hamiltonian application is needed.
+"""
+import numpy as np
+
+from profiling import PhaseTimer
+
+
+class Observables:
+    names = ("step", "t", "energy", "norm", "x", "p", "width")
+
+    def __init__(self, sim, every=10, capacity=1000):
+        self.sim = sim
+        self.every = every
+        self.capacity = capacity
+        # the energy computation is timed as the "energy" phase
+        self.timer = PhaseTimer()
+        self.clear()
+        sim.observables = self
+
+    def clear(self):
+        """
+        Starts a new, empty history.
+        """
+        batch_shape = self.sim.psi.shape[:-1]
+        self.buffers = dict()
+        for name in self.names:
+            shape = (self.capacity,)
+            if name not in ("step", "t"):
+                # ensemble members get one column each
+                shape += batch_shape
+            self.buffers[name] = np.full(shape, np.nan)
+        self.count = 0
+        self._last_step = None
+
+    def update(self):
+        """
+        Called by the simulator after every step.
+        """
+        sim = self.sim
+        if (
+            self._last_step is None
+            or sim.step_count - self._last_step >= self.every
+        ):
+            self.sample()
+        # ask the method for its energy estimate during the step before the
+        # next sample
+        sim.track_energy = sim.step_count + 1 - self._last_step >= self.every
+
+    def energy(self):
+        sim = self.sim
+        if sim.energy_estimate_step == sim.step_count:
+            return sim.energy_estimate
+        return sim.energy()
+
+    def sample(self):
+        """
+        Computes all observables for the current state and stores them.
+        """
+        sim = self.sim
+        psi = sim.psi
+        if psi.shape[:-1] != self.buffers["energy"].shape[1:] or (
+            self._last_step is not None and sim.step_count < self._last_step
+        ):
+            # psi was reset, start a new history
+            self.clear()
+
+        dx = sim.dx
+        density = np.abs(psi) ** 2
+        # in the precision of psi
+        x = sim.x.astype(density.dtype, copy=False)
+        norm_squared = np.sum(density, axis=-1) * dx
+        x_mean = density @ x * dx / norm_squared
+        x2_mean = density @ x**2 * dx / norm_squared
+        # <p> = -i hbar <psi|dpsi/dx>, with a periodic central difference
+        dpsi = (np.roll(psi, -1, axis=-1) - np.roll(psi, 1, axis=-1)) / (
+            2 * dx
+        )
+        overlap = np.sum(psi.conj() * dpsi, axis=-1) * dx
+        p_mean = sim.hbar * overlap.imag / norm_squared
+
+        with self.timer.phase("energy"):
+            energy = self.energy()
+        values = dict(
+            step=sim.step_count,
+            t=sim.t,
+            energy=energy,
+            norm=np.sqrt(norm_squared),
+            x=x_mean,
+            p=p_mean,
+            width=np.sqrt(np.maximum(x2_mean - x_mean**2, 0)),
+        )
+        i = self.count % self.capacity
+        for name, value in values.items():
+            self.buffers[name][i] = value
+        self.count += 1
+        self._last_step = sim.step_count
+
+    def history(self):
+        """
+        Copies of the stored values, oldest first.
+        """
+        n = min(self.count, self.capacity)
+        start = self.count - n
+        order = (np.arange(n) + start) % self.capacity
+        return {name: buffer[order] for name, buffer in self.buffers.items()}
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        i = (self.count - 1) % self.capacity
+        return {name: buffer[i] for name, buffer in self.buffers.items()}
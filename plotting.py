@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Plot data for large grids. Curves are min/max decimated to the pixel width
+of the plot and written into preallocated buffers, so rendering costs about
+the same for any N.
+"""
+import numpy as np
+
+
+def minmax_indices(curves, n_buckets):
+    """
+    Splits the grid into n_buckets equal parts and returns the sorted indices
+    of the minimum and maximum of every curve in each part, plus the first
+    and last point. Drawn as lines through these points, the curves look the
+    same as the full curves at a resolution of one bucket per pixel.
+
+    The curves can be strided views, e.g. psi.real, they are not copied.
+    """
+    n = len(curves[0])
+    size = -(-n // n_buckets)
+    n_full = n // size
+    offsets = np.arange(n_full) * size
+    parts = []
+    tails = []
+    for y in curves:
+        blocks = y[: n_full * size].reshape(n_full, size)
+        parts.append(np.argmin(blocks, axis=1) + offsets)
+        parts.append(np.argmax(blocks, axis=1) + offsets)
+        if n_full * size < n:
+            tail = y[n_full * size :]
+            tails.append(np.argmin(tail) + n_full * size)
+            tails.append(np.argmax(tail) + n_full * size)
+
+    indices = np.stack(parts, axis=1)
+    indices.sort(axis=1)
+    return np.concatenate(([0], indices.ravel(), np.sort(tails), [n - 1]))
+
+
+class PlotBuffer:
+    """
+    A preallocated array with x and a number of curves sampled at the same
+    points, updated in place every frame. With interleaved=True it has shape
+    (n_points, 1 + n_curves), the vertex layout of GLLinePlotItem, otherwise
+    (1 + n_curves, n_points) so every curve is contiguous.
+    """
+
+    def __init__(self, dtype=float, interleaved=False):
+        self.dtype = np.dtype(dtype)
+        self.interleaved = interleaved
+        self.data = None
+
+    def update(self, x, curves, n_buckets, scale=1.0):
+        """
+        Writes x and the curves (multiplied by scale) into data and returns
+        it. When there are more points than the min/max decimation to
+        n_buckets buckets would keep, only those points are written.
+        """
+        n_columns = 1 + len(curves)
+        index = None
+        if len(x) > 2 * len(curves) * n_buckets + 2:
+            index = minmax_indices(curves, n_buckets)
+        n_points = len(x) if index is None else len(index)
+
+        shape = (n_columns, n_points)
+        if self.interleaved:
+            shape = shape[::-1]
+        if self.data is None or self.data.shape != shape:
+            self.data = np.empty(shape, dtype=self.dtype)
+        columns = self.data.T if self.interleaved else self.data
+
+        np.copyto(columns[0], x if index is None else x[index])
+        for column, y in zip(columns[1:], curves):
+            if index is not None:
+                y = y[index]
+            np.multiply(y, scale, out=column)
+        return self.data
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight timers for the phases of the simulation and rendering loop.
+
+    timer = PhaseTimer(enabled=True)
+    with timer.phase("step"):
+        sim.step()
+    print(timer.summary())
+
+Every phase keeps the last `window` durations, from which the mean and the
+95th percentile are computed. When the timer is disabled phase() returns a
+shared no-op context manager, so the hooks can stay in place at no cost.
+"""
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+_null_phase = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+
+
+class PhaseTimer:
+    def __init__(self, enabled=False, window=300):
+        self.enabled = enabled
+        self.window = window
+        self.clear()
+        # phases are timed from the worker and the GUI thread
+        self._lock = threading.Lock()
+
+    def clear(self):
+        # name -> (ring buffer of durations, number of samples added)
+        self._samples = dict()
+
+    def phase(self, name):
+        """
+        Context manager that times its block as one sample of name.
+        """
+        if not self.enabled:
+            return _null_phase
+        return _Phase(self, name)
+
+    def add(self, name, seconds, count=1):
+        """
+        Adds a duration measured elsewhere. With count > 1 it is taken as
+        the total of count repetitions and stored as their mean, e.g. for a
+        batch of steps.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = [np.full(self.window, np.nan), 0]
+            samples = self._samples[name]
+            samples[0][samples[1] % self.window] = seconds / count
+            samples[1] += 1
+
+    def stats(self):
+        """
+        Dict of phase name -> dict with the mean, p95 and last duration in
+        seconds and the number of samples.
+        """
+        with self._lock:
+            samples = {
+                name: (buffer.copy(), count)
+                for name, (buffer, count) in self._samples.items()
+            }
+        stats = dict()
+        for name, (buffer, count) in samples.items():
+            values = buffer[: min(count, self.window)]
+            stats[name] = dict(
+                mean=float(np.mean(values)),
+                p95=float(np.percentile(values, 95)),
+                last=float(buffer[(count - 1) % self.window]),
+                count=count,
+            )
+        return stats
+
+    def summary(self):
+        """
+        One line per phase with the mean and p95 in milliseconds.
+        """
+        return "\n".join(
+            f"{name}: {s['mean'] * 1e3:.3f} ms (p95 {s['p95'] * 1e3:.3f})"
+            for name, s in self.stats().items()
+        )
+
+    def dump(self, path):
+        with open(path, "w") as stream:
+            json.dump(self.stats(), stream, indent=1)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Records the evolution of Simulator.psi to disk and reads it back.
+
+A recording is a directory with fixed size chunks of memory-mapped .npy
+files. Only the chunk that is being written is mapped, so memory use does not
+grow with the length of the run:
+
+    meta.json           shape, dtype, chunk size and number of frames
+    x.npy               the grid
+    potential.npy       the potential
+    psi_00000.npy       (chunk_size, *shape) snapshots of psi
+    steps_00000.npy     (chunk_size,) step_count of each snapshot
+    t_00000.npy         (chunk_size,) time of each snapshot
+"""
+import json
+import os
+
+import numpy as np
+
+
+class TrajectoryRecorder:
+    """
+    Appends snapshots of psi to a recording directory. With every=n,
+    record(sim) only stores a snapshot when sim.step_count is a multiple of
+    n, so it can simply be called after every step.
+    """
+
+    def __init__(
+        self,
+        path,
+        x,
+        potential,
+        shape=None,
+        dtype=complex,
+        every=1,
+        chunk_size=None,
+    ):
+        self.path = path
+        self.every = every
+        self.shape = tuple(shape) if shape is not None else (len(x),)
+        self.dtype = np.dtype(dtype)
+        if chunk_size is None:
+            # about 64 MB per chunk
+            frame_size = self.dtype.itemsize * int(np.prod(self.shape))
+            chunk_size = max(1, 2**26 // frame_size)
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._chunk = None
+        self._last_step = None
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "x.npy"), x)
+        np.save(os.path.join(path, "potential.npy"), potential)
+        self._write_meta()
+
+    @classmethod
+    def for_simulator(cls, path, sim, **kwargs):
+        return cls(
+            path, sim.x, sim.potential, sim.psi.shape, sim.psi.dtype, **kwargs
+        )
+
+    @classmethod
+    def resume(cls, path, step):
+        """
+        Reopens the recording at path to continue after the snapshot of
+        step, e.g. when a run continues from a checkpoint. The snapshots
+        recorded after that step are dropped.
+        """
+        reader = TrajectoryReader(path)
+        count = int(np.searchsorted(reader.steps, step, side="right"))
+        x, potential = reader.x, reader.potential
+        del reader
+        with open(os.path.join(path, "meta.json")) as stream:
+            meta = json.load(stream)
+
+        recorder = cls(
+            path,
+            x,
+            potential,
+            meta["shape"],
+            meta["dtype"],
+            every=meta["every"],
+            chunk_size=meta["chunk_size"],
+        )
+        recorder.count = count
+        i, j = divmod(count, recorder.chunk_size)
+        if j:
+            # continue writing into the last chunk
+            recorder._chunk = recorder._open_chunk(i, mode="r+")
+        if count:
+            recorder._last_step = step
+        recorder._write_meta()
+        return recorder
+
+    def _chunk_file(self, name, i):
+        return os.path.join(self.path, f"{name}_{i:05d}.npy")
+
+    def _open_chunk(self, i, mode="w+"):
+        def open_memmap(name, shape, dtype):
+            if mode == "r+":
+                shape = dtype = None
+            return np.lib.format.open_memmap(
+                self._chunk_file(name, i), mode=mode, dtype=dtype, shape=shape
+            )
+
+        size = self.chunk_size
+        return (
+            open_memmap("psi", (size,) + self.shape, self.dtype),
+            open_memmap("steps", (size,), np.int64),
+            open_memmap("t", (size,), float),
+        )
+
+    def _write_meta(self):
+        meta = dict(
+            shape=list(self.shape),
+            dtype=self.dtype.str,
+            chunk_size=self.chunk_size,
+            every=self.every,
+            count=self.count,
+        )
+        with open(os.path.join(self.path, "meta.json"), "w") as stream:
+            json.dump(meta, stream)
+
+    def append(self, psi, t, step):
+        i, j = divmod(self.count, self.chunk_size)
+        if j == 0:
+            self.flush()
+            self._chunk = self._open_chunk(i)
+        psi_chunk, steps_chunk, t_chunk = self._chunk
+        psi_chunk[j] = psi
+        steps_chunk[j] = step
+        t_chunk[j] = t
+        self.count += 1
+        self._last_step = step
+
+    def record(self, sim):
+        """
+        Appends sim.psi if sim.step_count is a multiple of every and it was
+        not recorded yet.
+        """
+        step = sim.step_count
+        if step % self.every == 0 and step != self._last_step:
+            self.append(sim.psi, sim.t, step)
+
+    def flush(self):
+        """
+        Writes the current chunk to disk and updates meta.json, so the
+        recording can be read up to here even if the run crashes later.
+        """
+        if self._chunk is not None:
+            for array in self._chunk:
+                array.flush()
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+        self._chunk = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Random access to a recording through memory maps, reader[i] returns the
+    i-th snapshot of psi without loading the rest of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as stream:
+            meta = json.load(stream)
+        self.count = meta["count"]
+        self.chunk_size = meta["chunk_size"]
+        self.every = meta["every"]
+        self.x = np.load(os.path.join(path, "x.npy"))
+        self.potential = np.load(os.path.join(path, "potential.npy"))
+
+        n_chunks = -(-self.count // self.chunk_size)
+        self._psi = [self._load("psi", i) for i in range(n_chunks)]
+        self.steps = self._concatenate("steps", n_chunks)
+        self.t = self._concatenate("t", n_chunks)
+
+    def _load(self, name, i):
+        return np.load(
+            os.path.join(self.path, f"{name}_{i:05d}.npy"), mmap_mode="r"
+        )
+
+    def _concatenate(self, name, n_chunks):
+        if n_chunks == 0:
+            return np.zeros(0)
+        arrays = [self._load(name, i) for i in range(n_chunks)]
+        return np.concatenate(arrays)[: self.count]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(f"frame {i} out of range")
+        chunk, j = divmod(i, self.chunk_size)
+        return self._psi[chunk][j]
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Named functions of the grid x with declared parameters, used for the
+potentials and initial wavefunctions. This module only needs NumPy, the
+widgets that are built from a registry live in gui_selectors.py.
+"""
+import numpy as np
+
+from cache import LRUCache
+
+
+class Registry:
+    """
+    Maps names to functions f(x, **params). The parameters of every function
+    are declared by name, their range, step and default value come from
+    settings, a param_control_settings dict.
+
+        registry = Registry(param_control_settings)
+
+        @registry.register("harmonic oscillator", "k")
+        def harmonic_oscillator(x, k):
+            return 0.5 * k * x**2
+
+        registry.evaluate("harmonic oscillator", x, k=10)
+
+    Functions registered with time_dependent=True return the separable form
+    (static, shape, modulation) of V(x, t) = static + modulation(t) * shape,
+    see Simulator.set_drive. evaluate(name, x, t) gives the full array at
+    time t for both kinds.
+
+    Evaluated arrays are cached per (name, params, N, L), so switching back
+    to a preset or parameter value that was used before costs nothing.
+    """
+
+    def __init__(self, settings, cache_bytes=2**26):
+        self.settings = settings
+        # name -> (function, parameter names, time dependent), in order of
+        # registration
+        self.functions = dict()
+        self.cache = LRUCache(cache_bytes)
+
+    def register(self, name, *params, time_dependent=False):
+        for param in params:
+            if param not in self.settings:
+                raise ValueError(f"{param!r} is not in the settings")
+
+        def decorator(function):
+            self.functions[name] = (function, params, time_dependent)
+            return function
+
+        return decorator
+
+    @property
+    def names(self):
+        return list(self.functions)
+
+    def params(self, name):
+        return self._lookup(name)[1]
+
+    def time_dependent(self, name):
+        return self._lookup(name)[2]
+
+    def defaults(self, name):
+        return {
+            param: self.settings[param]["value"] for param in self.params(name)
+        }
+
+    def parts(self, name, x, **params):
+        """
+        Evaluates the function called name on x and returns (static, shape,
+        modulation), with shape and modulation None if it does not depend
+        on time. Parameters that are not given get their default value. The
+        arrays are cached and read-only, copy them to modify them.
+        """
+        function, names, time_dependent = self._lookup(name)
+        unknown = set(params) - set(names)
+        if unknown:
+            raise ValueError(
+                f"{name!r} has no parameters {sorted(unknown)}, "
+                f"use {list(names)}"
+            )
+        values = self.defaults(name)
+        values.update(params)
+
+        def build():
+            if time_dependent:
+                static, shape, modulation = function(x, **values)
+                shape = np.asarray(shape)
+                shape.flags.writeable = False
+            else:
+                static, shape, modulation = function(x, **values), None, None
+            static = np.asarray(static)
+            static.flags.writeable = False
+            return static, shape, modulation
+
+        # the grid is identified by N and its end points, i.e. N and L
+        params_key = tuple(sorted(values.items()))
+        key = (name, params_key, len(x), float(x[0]), float(x[-1]))
+        try:
+            hash(key)
+        except TypeError:
+            # e.g. an array as parameter, don't cache
+            return build()
+        return self.cache.get(key, build)
+
+    def evaluate(self, name, x, t=0.0, **params):
+        """
+        Evaluates the function called name on x, at time t if it depends on
+        time. See parts.
+        """
+        static, shape, modulation = self.parts(name, x, **params)
+        if shape is None:
+            return static
+        return static + float(modulation(t)) * shape
+
+    def _lookup(self, name):
+        if name not in self.functions:
+            raise ValueError(f"Unknown {name!r}, use one of {self.names}")
+        return self.functions[name]
@@ -4,18 +4,79 @@ Created on Mon Oct 27 00:27:45 2025
 
 @author: bverr
 """
+import hashlib
+import warnings
+
 import numpy as np
-import scipy
+
+import kernels
+from cache import LRUCache
+
+# scipy.sparse is imported by the methods that need it, so creating a
+# Simulator stays fast for scripts that don't use them.
+
+# Central difference coefficients of the second derivative, c0 for the
+# point itself and ck for its neighbours at distance k, by order of accuracy:
+# psi'' = (c0 psi[i] + sum_k ck (psi[i-k] + psi[i+k])) / dx^2
+laplacian_stencils = {
+    2: (-2.0, 1.0),
+    4: (-5 / 2, 4 / 3, -1 / 12),
+    6: (-49 / 18, 3 / 2, -3 / 20, 1 / 90),
+    8: (-205 / 72, 8 / 5, -1 / 5, 8 / 315, -1 / 560),
+}
 
 
 class Simulator:
+    """
+    Simulates the 1D time dependent Schrödinger equation on a periodic grid.
+
+    psi can be a single wavefunction of shape (N,) or an ensemble of shape
+    (B, N). The potential can be shared, shape (N,), or given per member,
+    shape (B, N). All operations act along the last axis, so one step
+    advances the whole ensemble.
+    """
+
     methods = [
         "re_im_leapfrog",
         "forward_euler",
         "find_ground_state",
         "find_ground_state_arnoldi",
+        "find_ground_state_lanczos",
+        "split_operator",
+        "crank_nicolson",
+        "lanczos",
+        "spectral",
     ]
 
+    # order of accuracy in dt of the time evolution methods, used by
+    # run_adaptive. None means exact in time.
+    method_orders = {
+        "re_im_leapfrog": 2,
+        "forward_euler": 1,
+        "split_operator": 2,
+        "crank_nicolson": 2,
+        "lanczos": None,
+        "spectral": None,
+    }
+
+    # Laplacian that a method propagates with regardless of stencil_order,
+    # used to measure its energy drift
+    method_stencils = {"split_operator": "spectral"}
+
+    # (real dtype, complex dtype) of psi, the potential and the work arrays
+    # for each precision. Single precision halves the memory and the memory
+    # traffic of every step.
+    precision_dtypes = {
+        "double": (np.float64, np.complex128),
+        "single": (np.float32, np.complex64),
+    }
+    real_dtype, complex_dtype = precision_dtypes["double"]
+
+    # memory budget of the cached operators, see _cached. Older entries are
+    # kept as long as they fit, so e.g. alternating between two values of dt
+    # or between two potentials does not rebuild the operators every time.
+    cache_bytes = 2**28
+
     def __init__(
         self,
         N=100,
@@ -27,14 +88,68 @@ class Simulator:
         dt=0.1,
         method="re_im_leapfrog",
         potential_inf_at=100,
+        workspace=False,
+        debug=False,
+        backend="numpy",
+        n_eigenstates=50,
+        active_threshold=None,
+        active_margin=32,
+        stencil_order=2,
+        precision="double",
+        drift_tolerance=1e-3,
+        krylov_dim=30,
+        krylov_tolerance=1e-10,
     ):
 
+        # cached operators, see _cached
+        self._cache = LRUCache(self.cache_bytes)
+        # preallocated arrays for the workspace mode, see _buffer
+        self._buffers = dict()
+        # When True the methods update psi in place using preallocated
+        # buffers instead of allocating new arrays every step.
+        self.workspace = workspace
+        # When True hamiltonian stores its kinetic and potential parts in
+        # self.kinetic and self.potential_ for plotting/debugging.
+        self.debug = debug
+        self.backend = backend
+        # size of the eigenbasis used by the spectral method and seek
+        self.n_eigenstates = n_eigenstates
+        # expansion of psi in the eigenbasis, see _spectral_reference
+        self._spectral = None
+        # (width, strength, kind) of the absorbing layers, see set_absorber
+        self.absorber = None
+        # probability absorbed since the last set_psi, per ensemble member
+        self.absorbed = np.zeros(())
+        # When set, the stencil methods only update the window where |psi|
+        # is above active_threshold times its maximum, see active_window.
+        self.active_threshold = active_threshold
+        self.active_margin = active_margin
+        self._window = None
+        self._window_steps = 0
+        self.stencil_order = stencil_order
+        # In single precision the energy and norm are compared with their
+        # values after set_psi every drift_check_every steps, see
+        # _check_drift.
+        self.drift_tolerance = drift_tolerance
+        self.drift_check_every = 100
+        self._drift_reference = None
+        self._drift_warned = False
+        # largest Krylov subspace and error per step of the Lanczos
+        # methods, see _lanczos_propagate
+        self.krylov_dim = krylov_dim
+        self.krylov_tolerance = krylov_tolerance
+        # applications of H in the last Lanczos step
+        self.krylov_size = 0
+
+        self.N = N
+        self.L = L
         self.x = np.linspace(-L / 2, L / 2, num=N, endpoint=False)
-        self.dx = self.x[1] - self.x[0]
+        # a Python float, so it keeps the precision of the arrays it scales
+        self.dx = float(self.x[1] - self.x[0])
         if psi0 is None:
             self.psi = np.ones(N, dtype=complex)
         else:
-            self.psi = np.asarray(psi0, dtype=complex)
+            self.psi = np.array(psi0, dtype=complex)
         self.normalize()
 
         if potential is None:
@@ -43,6 +158,14 @@ class Simulator:
             potential = potential(self.x)
 
         self.potential = np.asarray(potential)
+        # time dependent part of the potential, see set_drive
+        self.drive = None
+        self._drive_key = 0
+        self._drive_value = None
+        # values that depend on the drive value, see _drive_cached
+        self._drive_values = dict()
+        # casts psi and the potential
+        self.precision = precision
 
         self.hbar = hbar
         self.m = m
@@ -50,53 +173,958 @@ class Simulator:
         self.method = method
         self.potential_inf_at = potential_inf_at
 
+        # elapsed simulation time and number of steps since the last set_psi
+        self.t = 0.0
+        self.step_count = 0
+        # (t, dt) of every step taken by run_adaptive
+        self.dt_history = []
+
+        # see observables.py, it is updated after every step when attached
+        self.observables = None
+        # When True, methods that can get the energy cheaply from their
+        # intermediate results store it in energy_estimate, for the state
+        # at step energy_estimate_step.
+        self.track_energy = False
+        self.energy_estimate = None
+        self.energy_estimate_step = -1
+
+    @property
+    def potential(self):
+        return self._potential
+
+    @potential.setter
+    def potential(self, potential):
+        # Everything derived from the potential is cached under this key. It
+        # only depends on the values, so assigning a potential that was used
+        # before (e.g. reset in MainWindow) reuses its cached operators.
+        self._potential = np.asarray(potential, dtype=self.real_dtype)
+        # the energy changes with the potential
+        self._drift_reference = None
+        self._potential_key = (
+            self._potential.shape,
+            self._potential.dtype.str,
+            hashlib.blake2b(
+                np.ascontiguousarray(self._potential), digest_size=16
+            ).digest(),
+        )
+
+    def set_drive(self, shape=None, modulation=None):
+        """
+        Makes the potential time dependent:
+
+            V(x, t) = potential + modulation(t) * shape
+
+        where modulation returns a float and shape has the shape of the
+        potential. self.potential stays the static part. Every step only the
+        modulation is evaluated (at the middle of the step), and everything
+        derived from the static part stays cached. set_drive() without
+        arguments makes the potential static again.
+
+        The walls (potential_inf_at) only come from the static part.
+        """
+        if shape is None:
+            self.drive = None
+        else:
+            self.drive = (np.asarray(shape, dtype=self.real_dtype), modulation)
+        self._drive_key += 1
+        self._drive_value = None
+        self._drive_values.clear()
+
+    def potential_at(self, t):
+        """
+        The full potential at time t.
+        """
+        if self.drive is None:
+            return self.potential
+        shape, modulation = self.drive
+        return self.potential + float(modulation(t)) * shape
+
+    def set_absorber(self, width=0.0, strength=10.0, kind="cap"):
+        """
+        Absorbing layers of the given width (in units of x) at both ends of
+        the periodic grid, so outgoing waves leave instead of wrapping
+        around. After every step psi is multiplied by a mask in the layers:
+
+            "cap"   exp(-W dt / hbar), the complex absorbing potential -i W
+                    with W = strength * (d / width)**2, where d is the depth
+                    into the layer
+            "mask"  cos(pi d / (2 width))**(1/8), independent of dt and
+                    strength. It is applied every step, so it absorbs more
+                    (and reflects more) for smaller dt.
+
+        The removed probability is added to self.absorbed, and normalize
+        keeps the norm at the probability that is left. width=0 switches
+        the layers off, the probability that was absorbed stays absorbed
+        until the next set_psi.
+        """
+        if kind not in ("cap", "mask"):
+            raise ValueError(f"Unknown absorber {kind!r}")
+        if width <= 0:
+            self.absorber = None
+        else:
+            self.absorber = (width, strength, kind)
+
+    def _absorber_masks(self):
+        """
+        The number of grid points in each layer and the mask and the
+        fraction of the density it removes, for the left and right layer.
+        """
+
+        width, strength, kind = self.absorber
+
+        def mask(distance):
+            # distance to the edge x = +-L/2 of the periodic grid
+            depth = np.clip(width - distance, 0, width)
+            if kind == "cap":
+                W = strength * (depth / width) ** 2
+                return np.exp(-W * self.dt / self.hbar)
+            return np.cos(np.pi * depth / (2 * width)) ** (1 / 8)
+
+        def build():
+            n = min(int(np.ceil(width / self.dx)), self.N // 2)
+            left = mask(self.x[:n] + self.L / 2).astype(self.real_dtype)
+            right = mask(self.L / 2 - self.x[self.N - n :])
+            right = right.astype(self.real_dtype)
+            return n, left, 1 - left**2, right, 1 - right**2
+
+        return self._cached(
+            "absorber_masks",
+            (
+                self.absorber,
+                self.N,
+                self.L,
+                self.dt,
+                self.hbar,
+                self.precision,
+            ),
+            build,
+        )
+
+    def _absorb(self):
+        """
+        Applies the absorbing layers to psi and adds the removed
+        probability to self.absorbed.
+        """
+        n, left, left_loss, right, right_loss = self._absorber_masks()
+        psi = self.psi
+        absorbed = 0
+        for layer, mask, loss in (
+            (psi[..., :n], left, left_loss),
+            (psi[..., -n:], right, right_loss),
+        ):
+            density = layer.real**2 + layer.imag**2
+            absorbed = absorbed + density @ loss * self.dx
+            layer *= mask
+        self.absorbed = self.absorbed + absorbed
+        # psi changed in place, so the spectral expansion is outdated
+        self._spectral = None
+
+    def absorbed_probability(self):
+        """
+        Probability absorbed by the layers since the last set_psi, per
+        ensemble member if psi is batched.
+        """
+        return self.absorbed.copy()
+
+    def _update_drive(self, t):
+        """
+        Evaluates the modulation of the drive at time t. The potential and
+        the operators derived from it are only rebuilt when the value
+        changed, see _drive_cached.
+        """
+        if self.drive is not None:
+            self._drive_value = float(self.drive[1](t))
+
+    def _drive_cached(self, name, build):
+        """
+        Like _cached, for values that depend on the current drive value.
+        These change every step, so only the last one is kept per name.
+        """
+        if self._drive_value is None:
+            self._update_drive(self.t)
+        key = (
+            self._potential_key,
+            self._drive_key,
+            self._drive_value,
+            self.dt,
+            self.m,
+            self.hbar,
+            self.stencil_order,
+            self.precision,
+        )
+        entry = self._drive_values.get(name)
+        if entry is None or entry[0] != key:
+            entry = (key, build())
+            self._drive_values[name] = entry
+        return entry[1]
+
+    def _total_potential(self):
+        """
+        The potential used by the current step, including the drive.
+        """
+        if self.drive is None:
+            return self.potential
+        shape = self.drive[0]
+        return self._drive_cached(
+            "potential", lambda: self.potential + self._drive_value * shape
+        )
+
+    @property
+    def backend(self):
+        """
+        "numpy", "numba" or "auto". The numba backend runs the explicit
+        methods as JIT compiled kernels (see kernels.py). When numba is not
+        installed it falls back to numpy.
+        """
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        if backend not in ("numpy", "numba", "auto"):
+            raise ValueError(f"Unknown backend {backend!r}")
+        if backend != "numpy" and not kernels.numba_available:
+            if backend == "numba":
+                warnings.warn("numba is not installed, using numpy backend")
+            backend = "numpy"
+        elif backend == "auto":
+            backend = "numba"
+        self._backend = backend
+
+    @property
+    def precision(self):
+        """
+        "double", "single" or "auto". Single precision stores psi as
+        complex64 and the potential and work arrays as float32. Its rounding
+        errors grow with N and with the number of steps, so the energy and
+        norm drift are watched (see _check_drift): "single" warns when they
+        exceed drift_tolerance, "auto" switches to double precision instead.
+        Assigning a precision casts psi and the potential.
+        """
+        return self._precision
+
+    @precision.setter
+    def precision(self, precision):
+        if precision not in ("double", "single", "auto"):
+            raise ValueError(f"Unknown precision {precision!r}")
+        self.upcast_on_drift = precision == "auto"
+        if precision == "auto":
+            precision = "single"
+        self._precision = precision
+        self.real_dtype, self.complex_dtype = self.precision_dtypes[precision]
+
+        self.psi = self.psi.astype(self.complex_dtype, copy=False)
+        self.potential = self.potential
+        if self.drive is not None:
+            self.set_drive(*self.drive)
+        self._drift_warned = False
+
+    @property
+    def stencil_order(self):
+        """
+        Order of accuracy in dx of the Laplacian, 2, 4, 6 or 8 for the
+        central differences in laplacian_stencils, or "spectral" for the
+        exact derivative of the Fourier interpolant. Higher orders have less
+        dispersion for short wavelengths, so a coarser grid gives the same
+        accuracy. split_operator is always spectral in space.
+        """
+        return self._stencil_order
+
+    @stencil_order.setter
+    def stencil_order(self, order):
+        if order != "spectral" and order not in laplacian_stencils:
+            raise ValueError(
+                f"Unknown stencil order {order!r}, use one of "
+                f"{list(laplacian_stencils)} or 'spectral'"
+            )
+        self._stencil_order = order
+        self._window_steps = 0
+        # the energy is measured with the new Laplacian
+        self._drift_reference = None
+
+    @property
+    def _stencil_width(self):
+        """
+        Number of neighbours on each side used by the Laplacian, 0 for the
+        spectral Laplacian which couples all points.
+        """
+        if self.stencil_order == "spectral":
+            return 0
+        return len(laplacian_stencils[self.stencil_order]) - 1
+
+    def _cached(self, name, key, build):
+        """
+        Returns the cached value of name if it was built for the same key,
+        otherwise calls build() and caches the result. The least recently
+        used values are dropped when they take more than cache_bytes.
+        """
+        return self._cache.get((name,) + key, build)
+
+    def _buffer(self, name, shape, dtype=None):
+        """
+        Returns a persistent work array, reallocated only when the requested
+        shape or dtype changes. The dtype defaults to the real dtype of the
+        precision.
+        """
+        if dtype is None:
+            dtype = self.real_dtype
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def _workspace_psi(self):
+        """
+        Makes sure psi can be updated in place and returns it.
+        """
+        psi = self.psi
+        if not (
+            psi.dtype == self.complex_dtype
+            and psi.flags.c_contiguous
+            and psi.flags.writeable
+        ):
+            self.psi = psi = np.array(psi, dtype=self.complex_dtype)
+        return psi
+
     def set_psi(self, psi, normalize=True):
-        self.psi = np.asarray(psi, dtype=complex)
+        # copy, psi is updated in place and must not alias the caller's array
+        self.psi = np.array(psi, dtype=self.complex_dtype)
+        self.absorbed = np.zeros(self.psi.shape[:-1])
+        # find the active window again
+        self._window_steps = 0
+        self._drift_reference = None
+        self._drift_warned = False
         if normalize:
             self.normalize()
+        self.t = 0.0
+        self.step_count = 0
+
+    def _interleaved(self, psi):
+        """
+        psi as a real array with the real and imaginary parts interleaved
+        along the last axis, without copying. None if psi is not a
+        contiguous array of the complex dtype.
+        """
+        if psi.dtype == self.complex_dtype and psi.flags.c_contiguous:
+            return psi.view(self.real_dtype)
+        return None
+
+    def norm(self):
+        """
+        Norm of psi, per ensemble member if psi is batched.
+        """
+        # einsum on real views avoids temporary arrays, and is fastest on
+        # the contiguous interleaved view
+        interleaved = self._interleaved(self.psi)
+        if interleaved is not None:
+            norm_squared = np.einsum(
+                "...i,...i->...", interleaved, interleaved
+            )
+            return np.sqrt(norm_squared * self.dx)
+        R, I = self.psi.real, self.psi.imag
+        norm_squared = np.einsum("...i,...i->...", R, R)
+        if np.iscomplexobj(self.psi):
+            norm_squared += np.einsum("...i,...i->...", I, I)
+        return np.sqrt(norm_squared * self.dx)
+
+    def energy(self):
+        """
+        Expectation value of the energy, per ensemble member if psi is
+        batched.
+        """
+        self._update_drive(self.t)
+        H_psi = self.hamiltonian(self.psi)
+        return np.sum(self.psi.conj() * H_psi, axis=-1).real * self.dx
 
     def normalize(self, inplace=True):
-        norm = np.linalg.norm(self.psi) * np.sqrt(self.dx)
+        norm = self.norm()[..., np.newaxis]
+        if np.any(self.absorbed):
+            # scale to the probability that was not absorbed, also after the
+            # layers were switched off
+            norm = norm / np.sqrt(1 - self.absorbed)[..., np.newaxis]
         # print(self.psi, norm)
         if inplace:
-            self.psi /= norm
+            self._last_norm = norm
+            interleaved = self._interleaved(self.psi)
+            if interleaved is not None and self.psi.flags.writeable:
+                # a real multiplication is several times faster than
+                # dividing by a real number in complex arithmetic
+                interleaved *= 1 / norm
+            else:
+                self.psi /= norm
 
             return self.psi
         else:
             return self.psi / norm
 
-    def hamiltonian(self, psi):
-        laplacian = (np.roll(psi, 1) + np.roll(psi, -1) - 2 * psi) / (
-            self.dx**2
-        )
+    def hamiltonian(self, psi, out=None):
+        """
+        Applies the Hamiltonian to psi. If out is given the result is written
+        into it without allocating any temporary arrays of the size of psi.
+        """
+        if out is not None:
+            return self._hamiltonian_inplace(psi, out)
+
+        laplacian = self._laplacian(psi, self.stencil_order)
         kinetic = -self.hbar**2 / (2 * self.m) * laplacian
-        potential = self.potential * psi
-        self.kinetic = kinetic
-        self.potential_ = potential.copy()
+        potential = self._total_potential() * psi
+        if self.debug:
+            self.kinetic = kinetic
+            self.potential_ = potential.copy()
         # print(potential)
         return kinetic + potential
 
+    def _laplacian(self, psi, order):
+        """
+        The Laplacian of psi with the stencil of the given order.
+        """
+        if order == "spectral":
+            return self._spectral_laplacian(psi)
+        coefficients = laplacian_stencils[order]
+        laplacian = coefficients[0] * psi
+        for k, c in enumerate(coefficients[1:], 1):
+            laplacian += c * (
+                np.roll(psi, k, axis=-1) + np.roll(psi, -k, axis=-1)
+            )
+        laplacian /= self.dx**2
+        return laplacian
+
+    def _hamiltonian_diagonal(self):
+        """
+        The stencil written as H psi = sum_k offs[k-1] * (psi[i-k] +
+        psi[i+k]) + diagonal * psi[i]. Returns (offs, diagonal). For the
+        spectral Laplacian offs is empty and diagonal is the potential.
+        """
+
+        def build():
+            if self.stencil_order == "spectral":
+                return (), self.potential
+            scale = -(self.hbar**2) / (2 * self.m * self.dx**2)
+            coefficients = laplacian_stencils[self.stencil_order]
+            offs = tuple(scale * c for c in coefficients[1:])
+            return offs, self.potential + scale * coefficients[0]
+
+        offs, diagonal = self._cached(
+            "hamiltonian_diagonal",
+            (self._potential_key, self.m, self.hbar, self.stencil_order),
+            build,
+        )
+        if self.drive is None:
+            return offs, diagonal
+
+        # only the drive is added every step
+        shape = self.drive[0]
+        return offs, self._drive_cached(
+            "diagonal", lambda: diagonal + self._drive_value * shape
+        )
+
+    @staticmethod
+    def _neighbour_sum(psi, k, out):
+        """
+        out = psi[i-k] + psi[i+k] with periodic boundaries, using slices
+        instead of np.roll copies.
+        """
+        N = psi.shape[-1]
+        np.add(psi[..., : N - 2 * k], psi[..., 2 * k :], out=out[..., k:-k])
+        np.add(psi[..., N - k :], psi[..., k : 2 * k], out=out[..., :k])
+        np.add(
+            psi[..., N - 2 * k : N - k], psi[..., :k], out=out[..., N - k :]
+        )
+        return out
+
+    def _spectral_laplacian(self, psi):
+        """
+        The second derivative of psi computed exactly in momentum space.
+        """
+        k_squared = self._cached(
+            "k_squared",
+            (self.N, self.L, self.precision),
+            lambda: (
+                (2 * np.pi * np.fft.fftfreq(self.N, d=self.dx)) ** 2
+            ).astype(self.real_dtype),
+        )
+        laplacian = np.fft.ifft(-k_squared * np.fft.fft(psi, axis=-1))
+        return laplacian.real if np.isrealobj(psi) else laplacian
+
+    def _hamiltonian_inplace(self, psi, out):
+        offs, diagonal = self._hamiltonian_diagonal()
+
+        if self.stencil_order == "spectral":
+            out[...] = self._spectral_laplacian(psi)
+            out *= -(self.hbar**2) / (2 * self.m)
+        else:
+            self._neighbour_sum(psi, 1, out)
+            out *= offs[0]
+            if len(offs) > 1:
+                neighbours = self._buffer("neighbours", out.shape, out.dtype)
+                for k, off in enumerate(offs[1:], 2):
+                    self._neighbour_sum(psi, k, neighbours)
+                    neighbours *= off
+                    out += neighbours
+
+        diagonal_part = self._buffer("diagonal_part", out.shape, out.dtype)
+        np.multiply(diagonal, psi, out=diagonal_part)
+        out += diagonal_part
+
+        if self.debug:
+            self.potential_ = self._total_potential() * psi
+            self.kinetic = out - self.potential_
+        return out
+
     def truncate_inf_potential(self):
         """
         This simulation considers the potential infinite when it is larger (or
         equal to) self.potential_inf_at. It will set the wavefunction to zero
         where this is the case.
         """
-        inf_potential_location = np.where(
-            self.potential >= self.potential_inf_at
+        self.psi[self._inf_potential_index()] = 0
+
+    def _inf_potential_index(self):
+        """
+        Index into psi of the points where the potential is infinite. It only
+        depends on the potential, so it is computed once instead of every
+        step.
+        """
+
+        def build():
+            location = np.nonzero(self.potential >= self.potential_inf_at)
+            return (Ellipsis,) + location
+
+        return self._cached(
+            "inf_potential_index",
+            (self._potential_key, self.potential_inf_at),
+            build,
         )
-        self.psi[inf_potential_location] = 0
+
+    def _set_energy_estimate(self, expectation):
+        """
+        Stores the energy of the state after the current step, from
+        expectation = <psi|H|psi> computed by the method before psi was
+        normalized.
+        """
+        norm_squared = self._last_norm[..., 0] ** 2
+        self.energy_estimate = expectation * self.dx / norm_squared
+        self.energy_estimate_step = self.step_count + 1
 
     def step(self):
-        if self.potential_inf_at is not None:
-            self.truncate_inf_potential()
+        self._advance(self._step, self._wall_index())
+
+    def _wall_index(self):
+        """
+        _inf_potential_index, or None without an infinite potential.
+        """
+        if self.potential_inf_at is None:
+            return None
+        return self._inf_potential_index()
+
+    def _advance(self, step, inf_potential_index, count=True):
+        """
+        Takes one step with step, the bound method of self.method, between
+        the work that every step needs: zeroing psi where the potential is
+        infinite (at inf_potential_index, see _wall_index), evaluating the
+        drive, the absorbing layers and advancing t. Loops look step and the
+        index up once. With count=False the step is a trial that is not
+        counted yet, see _count_steps.
+        """
+        if inf_potential_index is not None:
+            self.psi[inf_potential_index] = 0
+            if inf_potential_index[-1].size:
+                # psi changed in place, expand it again, see
+                # _spectral_reference
+                self._spectral = None
+        if self.drive is not None:
+            self._update_drive(self.t + self.dt / 2)
+        step()
+        if self.absorber is not None:
+            self._absorb()
+        if self.absorber is not None or step != self.spectral:
+            # the other methods and the absorber may update psi in place,
+            # which the expansion of spectral cannot detect
+            self._spectral = None
+        self.t += self.dt
+        if count:
+            self._count_steps(1)
+
+    def _count_steps(self, n):
+        """
+        Adds n steps to step_count, updates the attached observables and
+        checks the drift when it is due.
+        """
+        self.step_count += n
+        if self.observables is not None:
+            self.observables.update()
+        every = self.drift_check_every
+        if (
+            self.precision == "single"
+            and self.step_count // every != (self.step_count - n) // every
+        ):
+            self._check_drift()
+
+    def _check_drift(self):
+        """
+        Compares the energy and norm with their values at the first check
+        after set_psi. When the relative change of either is larger than
+        drift_tolerance, single precision is not accurate enough for this N
+        and dt: it warns, or switches to double precision if upcast_on_drift
+        is set. Not checked when the energy or norm change by design, i.e.
+        in imaginary time, with a drive or with absorbing layers.
+        """
+        if (
+            self.method not in self.method_orders
+            or self.drive is not None
+            or self.absorber is not None
+        ):
+            return
+        energy, norm = self._method_energy(), self.norm()
+        if self._drift_reference is None:
+            self._drift_reference = (energy, norm)
+            return
+        energy0, norm0 = self._drift_reference
+        energy_drift = np.max(
+            np.abs(energy - energy0) / np.maximum(np.abs(energy0), 1e-30)
+        )
+        norm_drift = np.max(np.abs(norm - norm0) / np.maximum(norm0, 1e-30))
+        drift = max(energy_drift, norm_drift)
+        if drift <= self.drift_tolerance:
+            return
 
-        self._step()
+        message = (
+            f"Single precision drift {drift:.1e} exceeds drift_tolerance "
+            f"{self.drift_tolerance:.1e} at t={self.t:g} (N={self.N}, "
+            f"dt={self.dt:g})"
+        )
+        if self.upcast_on_drift:
+            warnings.warn(message + ", switching to double precision")
+            self.precision = "double"
+        elif not self._drift_warned:
+            warnings.warn(message)
+            self._drift_warned = True
+
+    def _method_energy(self):
+        """
+        The energy with the Laplacian the method propagates with, see
+        method_stencils. Measured with another Laplacian, the energy of e.g.
+        split_operator changes by the difference between the two
+        discretizations, which has nothing to do with the precision.
+        """
+        order = self.method_stencils.get(self.method, self.stencil_order)
+        if order == self.stencil_order:
+            return self.energy()
+        self._update_drive(self.t)
+        laplacian = self._laplacian(self.psi, order)
+        H_psi = -(self.hbar**2) / (2 * self.m) * laplacian
+        H_psi += self._total_potential() * self.psi
+        return np.sum(self.psi.conj() * H_psi, axis=-1).real * self.dx
+
+    def run(
+        self,
+        n_steps,
+        observe_every=None,
+        observables=("energy", "norm"),
+        snapshots=True,
+    ):
+        """
+        Takes n_steps steps in a tight loop. This does the same as calling
+        step() n_steps times, but the wall mask and the method are looked up
+        only once.
+
+        Every observe_every steps, and always after the last step, the
+        observables (names of Simulator methods such as "energy" and "norm")
+        and, if snapshots is True, a copy of psi are recorded. Returns a dict
+        of arrays with keys "step", "t", "psi" and the observable names.
+        """
+        step = self._step
+        inf_potential_index = self._wall_index()
+
+        results = {"step": [], "t": []}
+        if snapshots:
+            results["psi"] = []
+        for name in observables:
+            results[name] = []
+
+        def observe():
+            results["step"].append(self.step_count)
+            results["t"].append(self.t)
+            if snapshots:
+                results["psi"].append(self.psi.copy())
+            for name in observables:
+                results[name].append(getattr(self, name)())
+
+        for i in range(1, n_steps + 1):
+            self._advance(step, inf_potential_index)
+            if observe_every and i % observe_every == 0 and i != n_steps:
+                observe()
+        observe()
+
+        return {name: np.asarray(values) for name, values in results.items()}
+
+    def run_adaptive(
+        self,
+        t_end,
+        tol=1e-6,
+        dt_min=None,
+        dt_max=None,
+        energy_tol=None,
+        safety=0.9,
+    ):
+        """
+        Evolves until t_end with a dt that adapts to the local error, using
+        step doubling: every step is taken once with dt and twice with dt/2.
+        The difference estimates the error, which is kept below tol. dt
+        starts at self.dt and stays within [dt_min, dt_max]. If energy_tol
+        is given, steps that change the energy by more than energy_tol
+        (relative) are rejected as well.
+
+        dt only changes by powers of two, so the operators cached by
+        split_operator and crank_nicolson are reused instead of rebuilt.
+
+        Returns a dict with the time and dt of every accepted step and the
+        number of rejected steps. The dt history is also appended to
+        self.dt_history.
+        """
+        if self.method not in self.method_orders:
+            raise ValueError(f"{self.method} is not a time evolution method")
+        order = self.method_orders[self.method]
+        dt0 = self.dt
+        dt_min = dt0 / 2**10 if dt_min is None else dt_min
+        dt_max = dt0 * 2**10 if dt_max is None else dt_max
+
+        # the powers of two within [dt_min, dt_max], with some slack for
+        # rounding when a bound is a power of two itself
+        lowest = np.ceil(np.log2(dt_min / dt0) - 1e-9)
+        highest = np.floor(np.log2(dt_max / dt0) + 1e-9)
+
+        def quantize(dt, rounding=np.round):
+            if lowest > highest:
+                # no power of two fits, use the bounds as they are
+                return min(max(dt, dt_min), dt_max)
+            exponent = rounding(np.log2(dt / dt0) + 1e-9)
+            return dt0 * 2.0 ** np.clip(exponent, lowest, highest)
+
+        # the shortest step, which is always accepted
+        dt_floor = quantize(dt_min)
+
+        step = self._step
+        inf_potential_index = self._wall_index()
+
+        def attempt(psi0, absorbed0, dt, n_steps):
+            self.psi = psi0.copy()
+            self.absorbed = absorbed0.copy()
+            self.dt = dt
+            for _ in range(n_steps):
+                self._advance(step, inf_potential_index, count=False)
+            return self.psi
+
+        history = {"t": [], "dt": [], "rejected": 0}
+        dt = quantize(dt0)
+        rejected = False
+        energy = self.energy() if energy_tol is not None else None
+        while self.t < t_end * (1 - 1e-12):
+            dt_step = min(dt, t_end - self.t)
+            t0 = self.t
+            psi0 = self.psi
+            absorbed0 = self.absorbed
+
+            psi_full = attempt(psi0, absorbed0, dt_step, 1)
+            self.t = t0
+            psi_half = attempt(psi0, absorbed0, dt_step / 2, 2)
+
+            if order is None:
+                error = 0.0
+            else:
+                difference = np.linalg.norm(psi_half - psi_full, axis=-1)
+                error = np.max(difference) * np.sqrt(self.dx)
+                error /= 2**order - 1
+
+            accept = error <= tol or dt_step <= dt_floor
+            if accept and energy_tol is not None:
+                new_energy = self.energy()
+                drift = np.max(np.abs(new_energy - energy))
+                if drift > energy_tol * np.max(np.abs(energy)):
+                    accept = dt_step <= dt_floor
+                else:
+                    energy = new_energy
+
+            if accept:
+                history["t"].append(self.t)
+                history["dt"].append(dt_step)
+                self.dt_history.append((self.t, dt_step))
+                self._count_steps(2)
+            else:
+                self.psi = psi0
+                self.absorbed = absorbed0
+                self.t = t0
+                history["rejected"] += 1
+
+            if order is None or error == 0:
+                factor = 2.0
+            else:
+                factor = safety * (tol / error) ** (1 / (order + 1))
+                factor = min(max(factor, 0.2), 2.0)
+            if not accept:
+                factor = min(factor, 0.5)
+            elif rejected:
+                # don't grow right after a rejection, this avoids bouncing
+                # against e.g. the stability limit of explicit methods
+                factor = min(factor, 1.0)
+            rejected = not accept
+            # dt only doubles when the error allows twice the step, rounding
+            # a smaller factor up would undo the safety factor and get the
+            # next step rejected
+            dt = quantize(dt * factor, np.floor if factor > 1 else np.round)
+
+        self.dt = dt
+        return {
+            "t": np.asarray(history["t"]),
+            "dt": np.asarray(history["dt"]),
+            "rejected": history["rejected"],
+        }
+
+    def active_window(self):
+        """
+        The range [lo, hi) of grid points updated by the stencil methods
+        when active_threshold is set, or None for the whole grid.
+
+        The window holds the points where |psi| is above active_threshold
+        times its maximum, plus active_margin points on both sides. The
+        stencil moves psi by at most one point per Hamiltonian application,
+        so the window is only searched again after the margin could have
+        been used up. Points outside the window are not updated, which
+        changes psi by about active_threshold relative to the full grid.
+        When the window would wrap around the periodic grid or cover most
+        of it, the whole grid is used, as it is for the spectral Laplacian.
+        """
+        width = self._stencil_width
+        if width == 0:
+            return None
+        if self._window_steps <= 0:
+            magnitude = np.abs(self.psi)
+            if magnitude.ndim > 1:
+                # one window for all members
+                magnitude = magnitude.reshape(-1, self.N).max(axis=0)
+            support = np.flatnonzero(
+                magnitude > self.active_threshold * magnitude.max()
+            )
+            margin = self.active_margin
+            lo = support[0] - margin if len(support) else 0
+            hi = support[-1] + 1 + margin if len(support) else self.N
+            if lo < width or hi > self.N - width or hi - lo > 0.75 * self.N:
+                self._window = None
+            else:
+                self._window = (int(lo), int(hi))
+            # re_im_leapfrog applies H twice per step, each moves psi by the
+            # width of the stencil
+            self._window_steps = max(margin // (2 * width), 1)
+        self._window_steps -= 1
+        return self._window
+
+    def _window_hamiltonian(self, src, lo, hi, out):
+        """
+        H src on the points lo:hi, written into out. The neighbours outside
+        the window, up to the width of the stencil, are read from src.
+        """
+        offs, diagonal = self._hamiltonian_diagonal()
+        np.add(src[..., lo - 1 : hi - 1], src[..., lo + 1 : hi + 1], out=out)
+        out *= offs[0]
+        diagonal_part = self._buffer("window_diagonal", out.shape, out.dtype)
+        for k, off in enumerate(offs[1:], 2):
+            np.add(
+                src[..., lo - k : hi - k],
+                src[..., lo + k : hi + k],
+                out=diagonal_part,
+            )
+            diagonal_part *= off
+            out += diagonal_part
+        np.multiply(diagonal[..., lo:hi], src[..., lo:hi], out=diagonal_part)
+        out += diagonal_part
+        return out
+
+    def _normalize_window(self, lo, hi):
+        """
+        normalize for the points lo:hi, the rest of psi is negligible.
+        """
+        window = self.psi[..., lo:hi]
+        R, I = window.real, window.imag
+        norm_squared = np.einsum("...i,...i->...", R, R)
+        norm_squared += np.einsum("...i,...i->...", I, I)
+        norm = np.sqrt(norm_squared * self.dx)[..., np.newaxis]
+        if np.any(self.absorbed):
+            norm = norm / np.sqrt(1 - self.absorbed)[..., np.newaxis]
+        self._last_norm = norm
+        window /= norm
+
+    def _active_leapfrog(self):
+        """
+        re_im_leapfrog on the active window. Returns False if the window is
+        the whole grid.
+        """
+        window = self.active_window()
+        if window is None:
+            return False
+        lo, hi = window
+        psi = self._workspace_psi()
+        R, I = psi.real, psi.imag
+        H = self._buffer("window_H", psi.shape[:-1] + (hi - lo,))
+
+        self._window_hamiltonian(I, lo, hi, H)
+        if self.track_energy:
+            expectation = np.einsum("...i,...i->...", I[..., lo:hi], H)
+        H *= self.dt
+        R[..., lo:hi] += H
+
+        self._window_hamiltonian(R, lo, hi, H)
+        if self.track_energy:
+            expectation += np.einsum("...i,...i->...", R[..., lo:hi], H)
+        H *= self.dt
+        I[..., lo:hi] -= H
+
+        self._normalize_window(lo, hi)
+        if self.track_energy:
+            self._set_energy_estimate(expectation)
+        return True
+
+    def _active_explicit(self, coefficient):
+        """
+        psi = psi + coefficient * H psi on the active window. Returns False
+        if the window is the whole grid.
+        """
+        window = self.active_window()
+        if window is None:
+            return False
+        lo, hi = window
+        psi = self._workspace_psi()
+        H_psi = self._buffer(
+            "window_H", psi.shape[:-1] + (hi - lo,), self.complex_dtype
+        )
+        self._window_hamiltonian(psi, lo, hi, H_psi)
+        H_psi *= coefficient
+        psi[..., lo:hi] += H_psi
+        self._normalize_window(lo, hi)
+        return True
 
     def forward_euler(self):
         """
         This is a "naive" forward Euler. It is unconditionally unstable.
         """
+        if self.active_threshold is not None and self._active_explicit(
+            -1j * self.dt
+        ):
+            return
+
+        if self.backend == "numba" and self.stencil_order == 2:
+            self._explicit_step_numba(-1j * self.dt)
+            self.normalize()
+            return
+
+        if self.workspace:
+            psi = self._workspace_psi()
+            H_psi = self.hamiltonian(
+                psi, out=self._buffer("H", psi.shape, self.complex_dtype)
+            )
+            H_psi *= -1j * self.dt
+            psi += H_psi
+            self.normalize()
+            return
 
         H = self.hamiltonian(self.psi)
         self.psi = self.psi - 1j * self.dt * H
@@ -106,6 +1134,43 @@ class Simulator:
         """
         https://scicomp.stackexchange.com/a/10880/26556
         """
+        if self.active_threshold is not None and self._active_leapfrog():
+            return
+
+        if self.backend == "numba" and self.stencil_order == 2:
+            (off,), diagonal = self._hamiltonian_diagonal()
+            kernels.leapfrog(self._workspace_psi(), off, diagonal, self.dt)
+            self.normalize()
+            return
+
+        # With track_energy the energy is <I|H|I> + <R|H|R> from the H I and
+        # H R that are computed anyway. It is staggered by half a step.
+        def dot(a, b):
+            # per ensemble member
+            return np.einsum("...i,...i->...", a, b)
+
+        if self.workspace:
+            # R and I are views into psi, so psi is updated in place
+            psi = self._workspace_psi()
+            R, I = psi.real, psi.imag
+            H = self._buffer("H", psi.shape)
+
+            self.hamiltonian(I, out=H)
+            if self.track_energy:
+                expectation = dot(I, H)
+            H *= self.dt
+            R += H
+
+            self.hamiltonian(R, out=H)
+            if self.track_energy:
+                expectation += dot(R, H)
+            H *= self.dt
+            I -= H
+
+            self.normalize()
+            if self.track_energy:
+                self._set_energy_estimate(expectation)
+            return
 
         R, I = self.psi.real, self.psi.imag
 
@@ -124,8 +1189,42 @@ class Simulator:
         self.psi = R + 1j * I
 
         self.normalize()
+        if self.track_energy:
+            self._set_energy_estimate(dot(I_old, H_I) + dot(R, H_R))
+
+    def _explicit_step_numba(self, coefficient):
+        """
+        psi = psi + coefficient * H psi with the fused kernel. The result is
+        written into a second buffer, which is swapped with psi.
+        """
+        psi = self._workspace_psi()
+        out = self._buffer("explicit_step", psi.shape, self.complex_dtype)
+        (off,), diagonal = self._hamiltonian_diagonal()
+        kernels.explicit_step(out, psi, off, diagonal, coefficient)
+        self._buffers["explicit_step"] = psi
+        self.psi = out
 
     def find_ground_state(self):
+        if self.active_threshold is not None and self._active_explicit(
+            -self.dt
+        ):
+            return
+
+        if self.backend == "numba" and self.stencil_order == 2:
+            self._explicit_step_numba(-self.dt)
+            self.normalize()
+            return
+
+        if self.workspace:
+            psi = self._workspace_psi()
+            H_psi = self.hamiltonian(
+                psi, out=self._buffer("H", psi.shape, self.complex_dtype)
+            )
+            H_psi *= -self.dt
+            psi += H_psi
+            self.normalize()
+            return
+
         H_psi = self.hamiltonian(self.psi)
         self.psi = self.psi - self.dt * H_psi
         # self.psi = self.psi - H_psi
@@ -136,49 +1235,559 @@ class Simulator:
         Gemini made this. The idea behind arnoldi iteration is to use multiple
         iterations of Hpsi, H^2psi, H^3psi etc.
         """
-        norm_old = np.linalg.norm(self.psi)
+        def vdot(a, b):
+            # per ensemble member
+            return np.sum(a.conj() * b, axis=-1, keepdims=True)
+
+        norm_old = np.linalg.norm(self.psi, axis=-1, keepdims=True)
         q1 = self.psi / norm_old
 
         # 2. Apply Hamiltonian (Generate the Krylov subspace)
         # We want the subspace span{q1, H*q1}
         H_q1 = self.hamiltonian(q1)
 
-        h11 = np.vdot(q1, H_q1).real
+        h11 = vdot(q1, H_q1).real
 
         residual = H_q1 - h11 * q1
 
-        h12 = np.linalg.norm(residual)
+        h12 = np.linalg.norm(residual, axis=-1, keepdims=True)
 
         # Safety check: If residual is 0, we are at the exact eigenstate
-        if np.abs(h12) < 1e-10:
+        converged = np.abs(h12) < 1e-10
+        if np.all(converged):
             self.psi = q1  # Keep old state
             self.normalize()
             return
 
         # q2 is the normalized residual
-        q2 = residual / h12
+        q2 = residual / np.where(converged, 1.0, h12)
 
         H_q2 = self.hamiltonian(q2)
 
-        h22 = np.vdot(q2, H_q2).real
+        h22 = vdot(q2, H_q2).real
 
         # Note: Because H is Hermitian, the matrix is tridiagonal.
         # The off-diagonal element <q1|H|q2> is exactly the norm h12 we calculated!
         # We construct the 2x2 matrix T:
         # [ h11  h12 ]
         # [ h12  h22 ]
-        H_sub = np.array([[h11, h12], [h12, h22]])
+        H_sub = np.empty(h11.shape[:-1] + (2, 2), dtype=h11.dtype)
+        H_sub[..., 0, 0] = h11[..., 0]
+        H_sub[..., 0, 1] = H_sub[..., 1, 0] = h12[..., 0]
+        H_sub[..., 1, 1] = h22[..., 0]
 
         evals, evecs = np.linalg.eigh(H_sub)
 
-        c1, c2 = evecs[:, 0]
-        c_norm = np.sqrt(c1**2 + c2**2)
+        c1 = np.where(converged, 1.0, evecs[..., 0, 0, np.newaxis])
+        c2 = np.where(converged, 0.0, evecs[..., 1, 0, np.newaxis])
         self.psi = c1 * q1 + c2 * q2
 
         # No need to normalize here explicitly as c1^2 + c2^2 = 1
         # and q1, q2 are orthonormal, but good for safety.
         self.normalize()
 
+    def _real_dot(self, a, b):
+        """
+        Re <a|b> per ensemble member, for contiguous arrays of the complex
+        dtype.
+        """
+        return np.einsum(
+            "...i,...i->...", self._interleaved(a), self._interleaved(b)
+        )
+
+    def _scale_add(self, a, x, y, scratch):
+        """
+        y += a * x for a real a per ensemble member, in real arithmetic on
+        the interleaved views.
+        """
+        scratch = self._interleaved(scratch)
+        a = np.asarray(a, dtype=self.real_dtype)[..., np.newaxis]
+        np.multiply(self._interleaved(x), a, out=scratch)
+        self._interleaved(y)[...] += scratch
+
+    def _tridiagonal_exponential(self, alpha, beta, tau, imaginary):
+        """
+        exp(-i T tau / hbar) e_1, or exp(-H tau / hbar) e_1 normalized if
+        imaginary, for the tridiagonal matrix T with diagonal alpha and off
+        diagonal beta[..., :-1], per ensemble member. Returns the
+        coefficients, the largest relative error estimate
+        beta[..., -1] |c[-1]| / |c| and the energy of the result.
+        """
+        k = alpha.shape[-1]
+        T = np.zeros(alpha.shape + (k,))
+        index = np.arange(k)
+        T[..., index, index] = alpha
+        T[..., index[:-1], index[1:]] = beta[..., :-1]
+        T[..., index[1:], index[:-1]] = beta[..., :-1]
+        energies, states = np.linalg.eigh(T)
+        if imaginary:
+            # relative to the lowest energy, so nothing overflows
+            weights = np.exp(-(energies - energies[..., :1]) * tau / self.hbar)
+        else:
+            weights = np.exp(-1j * energies * tau / self.hbar)
+        weights = weights * states[..., 0, :]
+        coefficients = np.einsum("...ij,...j->...i", states, weights)
+
+        norm = np.linalg.norm(coefficients, axis=-1)
+        error = np.max(beta[..., -1] * np.abs(coefficients[..., -1]) / norm)
+        population = np.abs(weights) ** 2
+        energy = np.sum(population * energies, axis=-1) / norm**2
+        return coefficients / norm[..., np.newaxis], error, energy
+
+    def _lanczos_propagate(self, dt, imaginary=False):
+        """
+        Replaces psi by exp(-i H dt / hbar) psi, or by exp(-H dt / hbar) psi
+        normalized if imaginary, computed in the Krylov subspace spanned by
+        psi, H psi, H^2 psi, ... The Lanczos recurrence gives an orthonormal
+        basis of it in which H is a small tridiagonal matrix T, so only T is
+        exponentiated. The subspace grows until the error estimate of Saad
+        (1992) is below krylov_tolerance. When krylov_dim vectors are not
+        enough, the step is split into shorter substeps. The basis vectors
+        are persistent buffers.
+        """
+        psi = self._workspace_psi()
+        shape = psi.shape
+        scratch = self._buffer("krylov_scratch", shape, self.complex_dtype)
+        # the tridiagonal matrix, in double precision
+        size = shape[:-1] + (self.krylov_dim,)
+        alpha = self._buffer("krylov_alpha", size, np.float64)
+        beta = self._buffer("krylov_beta", size, np.float64)
+        finfo = np.finfo(self.real_dtype)
+        # in single precision the rounding errors of the basis are larger
+        # than the default tolerance
+        tolerance = max(self.krylov_tolerance, 1000 * finfo.eps)
+        tiny = finfo.tiny
+        remaining = tau = dt
+        self.krylov_size = 0
+        while remaining > dt * 1e-12:
+            # a substep that was too long for krylov_dim will be again
+            tau = min(tau, remaining)
+            v = self._buffer("krylov_0", shape, self.complex_dtype)
+            v[...] = psi
+            norm = np.sqrt(self._real_dot(v, v))
+            scale = np.where(norm > tiny, norm, 1.0)
+            self._interleaved(v)[...] *= (1 / scale)[..., np.newaxis]
+            basis = [v]
+            # log of the first Taylor term of the error estimate,
+            # prod(beta) (tau / hbar)^j / j!
+            log_term = np.zeros(shape[:-1])
+            for j in range(self.krylov_dim):
+                w = self._buffer(f"krylov_{j + 1}", shape, self.complex_dtype)
+                self.hamiltonian(basis[j], out=w)
+                self.krylov_size += 1
+                alpha[..., j] = self._real_dot(basis[j], w)
+                self._scale_add(-alpha[..., j], basis[j], w, scratch)
+                if j > 0:
+                    self._scale_add(
+                        -beta[..., j - 1], basis[j - 1], w, scratch
+                    )
+                beta[..., j] = np.sqrt(np.maximum(self._real_dot(w, w), 0))
+
+                with np.errstate(divide="ignore"):
+                    log_term += np.log(beta[..., j] * tau / self.hbar)
+                log_term -= np.log(j + 1)
+                if j + 1 == self.krylov_dim or (
+                    np.max(log_term) < 0 and (j + 1) % 4 == 0
+                ):
+                    # once the terms of the Taylor series decrease the error
+                    # can be small enough. It is computed only for every
+                    # few vectors, as it costs about as much as a vector.
+                    coefficients, error, energy = (
+                        self._tridiagonal_exponential(
+                            alpha[..., : j + 1],
+                            beta[..., : j + 1],
+                            tau,
+                            imaginary,
+                        )
+                    )
+                    if error <= tolerance:
+                        break
+                inverse = np.where(beta[..., j] > tiny, 1 / beta[..., j], 0.0)
+                self._interleaved(w)[...] *= inverse[..., np.newaxis]
+                basis.append(w)
+            k = j + 1
+            if error > tolerance:
+                # the subspace is too small for tau, but fine for a shorter
+                # substep. The error grows about as tau^k, start from where
+                # the Taylor term equals the tolerance.
+                log_term = max(np.max(log_term), np.log(error))
+                tau *= min(np.exp((np.log(tolerance) - log_term) / k), 0.9)
+                coefficients, error, energy = self._tridiagonal_exponential(
+                    alpha[..., :k], beta[..., :k], tau, imaginary
+                )
+            while error > tolerance and tau > dt * 2**-30:
+                tau *= 0.9 * (tolerance / error) ** (1 / k)
+                coefficients, error, energy = self._tridiagonal_exponential(
+                    alpha[..., :k], beta[..., :k], tau, imaginary
+                )
+
+            coefficients = coefficients * norm[..., np.newaxis]
+            coefficients = coefficients.astype(self.complex_dtype)
+            np.multiply(basis[0], coefficients[..., :1], out=psi)
+            for j in range(1, k):
+                np.multiply(
+                    basis[j], coefficients[..., j, np.newaxis], out=scratch
+                )
+                psi += scratch
+            remaining -= tau
+
+        if self.track_energy and self.drive is None:
+            self.energy_estimate = energy
+            self.energy_estimate_step = self.step_count + 1
+
+    def lanczos(self):
+        """
+        Short iterative Lanczos, exp(-i H dt / hbar) psi in an adaptive
+        Krylov subspace, see _lanczos_propagate. It is unitary and exact in
+        time up to krylov_tolerance, so dt is only limited by the cost of a
+        step, krylov_size applications of H, which grows about linearly with
+        dt times the largest energy. With a drive the potential is taken at
+        the middle of the step.
+        """
+        self._lanczos_propagate(self.dt)
+        self.normalize()
+
+    def find_ground_state_lanczos(self):
+        """
+        Imaginary time evolution exp(-H dt / hbar) psi with the Krylov
+        subspace of lanczos. Unlike find_ground_state, dt is not limited by
+        stability, so a large dt reaches the ground state in a few steps.
+        """
+        self._lanczos_propagate(self.dt, imaginary=True)
+        self.normalize()
+
+    def _split_operator_phases(self):
+        def build_kinetic_phase():
+            k = 2 * np.pi * np.fft.fftfreq(self.N, d=self.dx)
+            phase = np.exp(-1j * self.hbar * k**2 * self.dt / (2 * self.m))
+            return phase.astype(self.complex_dtype)
+
+        def build_potential_phase():
+            return np.exp(-1j * self.potential * self.dt / (2 * self.hbar))
+
+        kinetic_phase = self._cached(
+            "kinetic_phase",
+            (self.N, self.L, self.dt, self.m, self.hbar, self.precision),
+            build_kinetic_phase,
+        )
+        half_potential_phase = self._cached(
+            "half_potential_phase",
+            (self._potential_key, self.dt, self.hbar),
+            build_potential_phase,
+        )
+        if self.drive is not None:
+            # the static phase stays cached, only the drive is updated
+            static_phase, shape = half_potential_phase, self.drive[0]
+
+            def build_driven_phase():
+                drive = self._drive_value * shape
+                return static_phase * np.exp(
+                    -1j * drive * self.dt / (2 * self.hbar)
+                )
+
+            half_potential_phase = self._drive_cached(
+                "half_potential_phase", build_driven_phase
+            )
+        return half_potential_phase, kinetic_phase
+
+    def split_operator(self):
+        """
+        Strang splitting exp(-iVdt/2) exp(-iTdt) exp(-iVdt/2). The kinetic
+        part is applied exactly in momentum space, so every step is unitary
+        and dt is only limited by accuracy, not by stability.
+        """
+        half_potential_phase, kinetic_phase = self._split_operator_phases()
+
+        psi_k = np.fft.fft(self.psi * half_potential_phase, axis=-1)
+        psi_k *= kinetic_phase
+        self.psi = np.fft.ifft(psi_k, axis=-1)
+        self.psi *= half_potential_phase
+
+        self.normalize()
+
+    @staticmethod
+    def _cyclic_tridiagonal_solver(a_diag, a_off):
+        """
+        Factorizes the periodic tridiagonal matrix with diagonal a_diag and
+        constant off-diagonal (and corner) elements a_off. The corners are
+        split off with Sherman-Morrison, so only the plain tridiagonal part
+        has to be LU factorized. The returned function solves A x = b in O(N)
+        for b of shape (N,) or (N, K).
+        """
+        import scipy.sparse
+        import scipy.sparse.linalg
+
+        N = len(a_diag)
+        a_diag = np.array(a_diag, dtype=complex)
+
+        # A = T + u v^T, with the corner elements moved into u v^T
+        gamma = -a_diag[0]
+        a_diag[0] -= gamma
+        a_diag[-1] -= a_off * a_off / gamma
+        T = scipy.sparse.diags(
+            [np.full(N - 1, a_off), a_diag, np.full(N - 1, a_off)],
+            [-1, 0, 1],
+            format="csc",
+        )
+        lu = scipy.sparse.linalg.splu(T, permc_spec="NATURAL")
+
+        u = np.zeros(N, dtype=complex)
+        u[0] = gamma
+        u[-1] = a_off
+        v_last = a_off / gamma
+        z = lu.solve(u)
+        z_denominator = 1 + z[0] + v_last * z[-1]
+
+        def solve(b):
+            y = lu.solve(b)
+            y -= np.multiply.outer(z, (y[0] + v_last * y[-1]) / z_denominator)
+            return y
+
+        return solve
+
+    @staticmethod
+    def _banded_solver(a_diag, a_offs):
+        """
+        Factorizes the periodic banded matrix with diagonal a_diag and
+        constant elements a_offs[k-1] at distance k from the diagonal, for
+        the wider stencils. The returned function solves A x = b for b of
+        shape (N,) or (N, K).
+        """
+        import scipy.sparse.linalg
+
+        A = Simulator._periodic_banded(np.asarray(a_diag, complex), a_offs)
+        return scipy.sparse.linalg.splu(A.tocsc()).solve
+
+    @staticmethod
+    def _periodic_banded(diagonal, offs):
+        """
+        The sparse (N, N) matrix with diagonal and the constants offs[k-1]
+        at distance k from the diagonal, wrapped around periodically.
+        """
+        import scipy.sparse
+
+        N = len(diagonal)
+        values, positions = [diagonal], [0]
+        for k, off in enumerate(offs, 1):
+            # neighbours at distance k, and the corners of the periodic grid
+            values += [off, off, off, off]
+            positions += [k, -k, N - k, k - N]
+        return scipy.sparse.diags(
+            values, positions, shape=(N, N), format="csr"
+        )
+
+    def _crank_nicolson_solver(self):
+        """
+        Returns a function that solves (1 + i dt H / (2 hbar)) x = b along the
+        last axis of b, for a shared or a per member potential. With a drive
+        it is factorized again whenever the drive value changes.
+        """
+        if self.stencil_order == "spectral":
+            raise ValueError(
+                "crank_nicolson needs a finite difference stencil"
+            )
+
+        def build():
+            c = 1j * self.dt / (2 * self.hbar)
+            offs, diagonal = self._hamiltonian_diagonal()
+            a_diag = 1 + c * diagonal
+            a_offs = [c * off for off in offs]
+
+            def factorize(a_diag):
+                if len(a_offs) == 1:
+                    return self._cyclic_tridiagonal_solver(a_diag, a_offs[0])
+                return self._banded_solver(a_diag, a_offs)
+
+            if a_diag.ndim < 2:
+                a_diag = np.broadcast_to(a_diag, (self.N,))
+                shared_solve = factorize(a_diag)
+
+                def solve(b):
+                    # the factorization solves for all members at once
+                    return shared_solve(b.T).T
+
+            else:
+                member_solves = [factorize(d) for d in a_diag]
+
+                def solve(b):
+                    b = np.broadcast_to(b, a_diag.shape)
+                    return np.stack(
+                        [s(b_i) for s, b_i in zip(member_solves, b)]
+                    )
+
+            return solve
+
+        if self.drive is not None:
+            return self._drive_cached("crank_nicolson_solver", build)
+        return self._cached(
+            "crank_nicolson_solver",
+            (
+                self._potential_key,
+                self.dt,
+                self.m,
+                self.hbar,
+                self.stencil_order,
+            ),
+            build,
+        )
+
+    def crank_nicolson(self):
+        """
+        Implicit Crank-Nicolson, (1 + i dt H / 2) psi' = (1 - i dt H / 2) psi.
+        It is unitary and unconditionally stable. The matrix on the left is
+        factorized once and reused until the potential, dt, m or hbar change.
+        """
+        solve = self._crank_nicolson_solver()
+
+        H_psi = self.hamiltonian(self.psi)
+        rhs = self.psi - 1j * self.dt / (2 * self.hbar) * H_psi
+        # the factorization is in double precision
+        self.psi = solve(rhs).astype(self.complex_dtype, copy=False)
+
+        self.normalize()
+
+    def sparse_hamiltonian(self):
+        """
+        The Hamiltonian as a sparse (N, N) matrix, with the same periodic
+        stencil as hamiltonian. Only defined for a shared potential and a
+        finite difference stencil.
+        """
+
+        def build():
+            if self.potential.ndim > 1:
+                raise ValueError("This needs a potential of shape (N,)")
+            if self.stencil_order == "spectral":
+                raise ValueError("The spectral Laplacian is not sparse")
+            offs, diagonal = self._hamiltonian_diagonal()
+            diagonal = np.broadcast_to(diagonal, (self.N,))
+            return self._periodic_banded(diagonal, offs).tocsc()
+
+        return self._cached(
+            "sparse_hamiltonian",
+            (self._potential_key, self.m, self.hbar, self.stencil_order),
+            build,
+        )
+
+    def _dense_spectral_hamiltonian(self):
+        """
+        The Hamiltonian with the spectral Laplacian as a dense (N, N) matrix,
+        the kinetic part is the circulant with the spectrum hbar^2 k^2 / 2m.
+        """
+        if self.potential.ndim > 1:
+            raise ValueError("This needs a potential of shape (N,)")
+        k = 2 * np.pi * np.fft.fftfreq(self.N, d=self.dx)
+        column = np.fft.ifft(self.hbar**2 * k**2 / (2 * self.m)).real
+        index = np.arange(self.N)
+        H = column[(index[:, np.newaxis] - index) % self.N]
+        H[index, index] += np.broadcast_to(self.potential, (self.N,))
+        return H
+
+    def eigenstates(self):
+        """
+        The lowest n_eigenstates eigenpairs of the Hamiltonian. Returns the
+        energies, shape (k,), and the eigenstates as columns of an (N, k)
+        array with unit Euclidean norm. They are cached per potential.
+        """
+
+        import scipy.sparse.linalg
+
+        def build():
+            k = min(self.n_eigenstates, self.N)
+            if self.stencil_order == "spectral":
+                energies, states = np.linalg.eigh(
+                    self._dense_spectral_hamiltonian()
+                )
+                return energies[:k], states[:, :k]
+            H = self.sparse_hamiltonian()
+            if k >= self.N - 1:
+                energies, states = np.linalg.eigh(H.toarray())
+                return energies[:k], states[:, :k]
+            # Shift-invert just below the spectrum finds the lowest states
+            # fast. The kinetic part is positive so min(V) is a lower bound.
+            sigma = np.min(self.potential) - 1.0
+            energies, states = scipy.sparse.linalg.eigsh(
+                H, k=k, sigma=sigma, which="LM"
+            )
+            order = np.argsort(energies)
+            return energies[order], states[:, order]
+
+        return self._cached(
+            "eigenstates",
+            (
+                self._potential_key,
+                self.m,
+                self.hbar,
+                self.n_eigenstates,
+                self.stencil_order,
+            ),
+            build,
+        )
+
+    def _spectral_reference(self):
+        """
+        The expansion of psi in the eigenbasis, together with the time it
+        was taken at. psi is only expanded again when the eigenbasis changes
+        or when psi was replaced by something other than psi_at. Everything
+        that changes psi in place clears _spectral, see _advance.
+        """
+        energies, states = self.eigenstates()
+        key = (
+            self._potential_key,
+            self.m,
+            self.hbar,
+            len(energies),
+            self.stencil_order,
+        )
+        reference = self._spectral
+        if (
+            reference is None
+            or reference[0] != key
+            or reference[1] is not self.psi
+        ):
+            coefficients = self.psi @ states.conj()
+            reference = (key, self.psi, self.t, coefficients)
+            self._spectral = reference
+        return reference
+
+    def psi_at(self, t):
+        """
+        Evaluates psi at time t in O(kN) without stepping, using the
+        expansion in the lowest n_eigenstates eigenstates. This is exact
+        (up to the truncation of the basis) for any t.
+        """
+        energies, states = self.eigenstates()
+        key, psi, t0, coefficients = self._spectral_reference()
+        phase = np.exp(-1j * energies * (t - t0) / self.hbar)
+        psi = (coefficients * phase) @ states.T
+        return psi.astype(self.complex_dtype, copy=False)
+
+    def seek(self, t):
+        """
+        Jumps to time t, see psi_at.
+        """
+        key, psi, t0, coefficients = self._spectral_reference()
+        self.psi = self.psi_at(t)
+        self.t = t
+        self._spectral = (key, self.psi, t0, coefficients)
+
+    def spectral(self):
+        """
+        Steps by evaluating the eigenstate expansion at t + dt, see psi_at.
+        psi is not normalized, its norm is the weight of the initial state in
+        the truncated basis.
+        """
+        if self.drive is not None:
+            raise ValueError("spectral needs a static potential")
+        key, psi, t0, coefficients = self._spectral_reference()
+        self.psi = self.psi_at(self.t + self.dt)
+        self._spectral = (key, self.psi, t0, coefficients)
+
+        if self.track_energy:
+            energies, states = self.eigenstates()
+            weights = np.abs(coefficients) ** 2
+            self.energy_estimate = weights @ energies / weights.sum(axis=-1)
+            self.energy_estimate_step = self.step_count + 1
+
     @property
     def method(self):
         return self._method
@@ -187,3 +1796,5 @@ class Simulator:
     def method(self, _method):
         self._method = _method
         self._step = getattr(self, _method)
+        self._drift_reference = None
+        self._spectral = None
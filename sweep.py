@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a headless simulation for every combination of parameter values, in
+parallel on all cores, and collects scalar results into one csv table.
+
+    python sweep.py sweep.yaml
+
+The config file has the keys of a headless.py config, plus:
+
+    potential:
+      name: square barrier
+      w: 0.02
+    wavefunction:
+      name: wavepacket
+      mu: -0.25
+    steps: 600
+    sweep:
+      V0: [0, 2, 4, 8]
+      momentum: {start: 5, stop: 20, num: 16}
+    outputs: [transmission, energy]
+    transmission_at: 0.0
+    table: sweep.csv
+
+Every key in sweep takes a list of values or the arguments of np.linspace.
+Parameters of the chosen potential or wavefunction (the keys of
+param_control_settings in potentials.py and wavefunctions.py) are passed to
+it, other keys such as dt, N or method replace the config value. Write
+potential.a or wavefunction.a when both have a parameter a.
+
+The outputs are computed from the final state, see output_functions. The
+runs are handed to the worker processes in chunks of chunk_size, and the
+rows of every finished chunk are appended to the csv right away. Running
+the same sweep again skips the parameter values that are already in the
+csv, so a sweep that was interrupted or whose worker crashed continues
+where it stopped. A run that raises an exception gets its message in the
+error column and is not repeated, remove its row to run it again.
+"""
+import argparse
+import concurrent.futures
+import csv
+import io
+import itertools
+import os
+import time
+
+import numpy as np
+
+import headless
+import potentials
+import wavefunctions
+
+default_outputs = ("transmission", "energy", "norm")
+
+
+def _probability(sim, mask):
+    density = sim.psi.real**2 + sim.psi.imag**2
+    return density[..., mask].sum(axis=-1) * sim.dx
+
+
+def transmission(sim, config):
+    """
+    Probability to the right of transmission_at (default 0).
+    """
+    return _probability(sim, sim.x > config.get("transmission_at", 0.0))
+
+
+def reflection(sim, config):
+    """
+    Probability to the left of transmission_at (default 0).
+    """
+    return _probability(sim, sim.x <= config.get("transmission_at", 0.0))
+
+
+def mean_x(sim, config):
+    density = sim.psi.real**2 + sim.psi.imag**2
+    return density @ sim.x / density.sum(axis=-1)
+
+
+# name -> function of the simulator after the run and its config, returning
+# a number or one number per ensemble member
+output_functions = dict(
+    transmission=transmission,
+    reflection=reflection,
+    x=mean_x,
+    energy=lambda sim, config: sim.energy(),
+    norm=lambda sim, config: sim.norm(),
+    absorbed_probability=lambda sim, config: sim.absorbed_probability(),
+)
+
+
+def _values(spec):
+    """
+    The values of a sweep parameter: a list, the keyword arguments of
+    np.linspace, or a single value.
+    """
+    if isinstance(spec, dict):
+        return np.linspace(**spec).tolist()
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+    return [spec]
+
+
+def _format(value):
+    # ensemble members are separated by spaces, as in headless.py
+    return " ".join(map(str, np.ravel(value)))
+
+
+def apply_parameter(config, key, value):
+    """
+    Sets the sweep parameter key to value in config.
+    """
+    target, _, param = key.rpartition(".")
+    registries = dict(
+        potential=potentials.registry, wavefunction=wavefunctions.registry
+    )
+    if target:
+        if target not in registries:
+            raise ValueError(f"Unknown sweep parameter {key!r}")
+        targets = [target]
+    else:
+        targets = [
+            name
+            for name, registry in registries.items()
+            if param in registry.params(headless._parse(config[name])[0])
+        ]
+    if len(targets) > 1:
+        raise ValueError(
+            f"Both the potential and the wavefunction have a parameter "
+            f"{param!r}, use potential.{param} or wavefunction.{param}"
+        )
+    if not targets:
+        if key not in headless.default_config:
+            raise ValueError(f"Unknown sweep parameter {key!r}")
+        config[key] = value
+        return
+
+    name, params = headless._parse(config[targets[0]])
+    if param not in registries[targets[0]].params(name):
+        raise ValueError(f"{name!r} has no parameter {param!r}")
+    params[param] = value
+    config[targets[0]] = dict(name=name, **params)
+
+
+def run_one(config, outputs):
+    """
+    Runs the simulation of one point of the sweep and returns a dict with
+    the outputs.
+    """
+    sim = headless.make_simulator(config)
+    sim.run(config["steps"], observables=(), snapshots=False)
+    return {name: output_functions[name](sim, config) for name in outputs}
+
+
+def _run_chunk(chunk, outputs):
+    """
+    Runs the (index, values, config) of a chunk in a worker process and
+    returns the csv rows. A run that raises gets its message in the error
+    column instead of stopping the sweep.
+    """
+    rows = []
+    for index, values, config in chunk:
+        start = time.perf_counter()
+        try:
+            results = run_one(config, outputs)
+            error = ""
+        except Exception as exc:
+            results = {name: np.nan for name in outputs}
+            error = f"{type(exc).__name__}: {exc}"
+        row = [index] + [_format(value) for value in values]
+        row += [_format(results[name]) for name in outputs]
+        row += [f"{time.perf_counter() - start:.3f}", error]
+        rows.append(row)
+    return rows
+
+
+def _init_worker():
+    # the processes already use all cores, so the numba kernels should not
+    # start threads of their own
+    os.environ.setdefault("NUMBA_NUM_THREADS", "1")
+
+
+def _read_done(path, header, n_params):
+    """
+    The parameter values of the complete rows in the csv at path. Rows that
+    were cut off by a crash are removed from the file.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as stream:
+        text = stream.read()
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return set()
+    if rows[0] != header:
+        raise ValueError(
+            f"{path} has the columns {rows[0]}, not {header}. Remove it or "
+            f"choose another table to start a new sweep."
+        )
+    if not text.endswith("\n"):
+        # the last row was not finished
+        rows.pop()
+    complete = [row for row in rows[1:] if len(row) == len(header)]
+    if len(complete) < len(rows) - 1 or not text.endswith("\n"):
+        temporary = path + ".tmp"
+        with open(temporary, "w", newline="") as stream:
+            csv.writer(stream).writerows([header] + complete)
+        os.replace(temporary, path)
+    return {tuple(row[1 : 1 + n_params]) for row in complete}
+
+
+def sweep(
+    config,
+    grids,
+    outputs=default_outputs,
+    path="sweep.csv",
+    workers=None,
+    chunk_size=None,
+):
+    """
+    Runs config (a headless config) for every combination of the values in
+    grids, a dict of parameter name -> values, and appends a row per run to
+    the csv at path. Runs whose parameter values are already in the csv are
+    skipped. With workers=1 everything runs in this process. Returns the
+    whole table, see load.
+    """
+    for name in outputs:
+        if name not in output_functions:
+            raise ValueError(
+                f"Unknown output {name!r}, use one of {list(output_functions)}"
+            )
+    keys = list(grids)
+    header = ["index"] + keys + list(outputs) + ["seconds", "error"]
+    done = _read_done(path, header, len(keys))
+
+    tasks = []
+    combinations = itertools.product(*(_values(grids[key]) for key in keys))
+    for index, values in enumerate(combinations):
+        if tuple(_format(value) for value in values) in done:
+            continue
+        task_config = dict(config)
+        for key, value in zip(keys, values):
+            # checks the parameter names before anything runs
+            apply_parameter(task_config, key, value)
+        tasks.append((index, values, task_config))
+
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # a few chunks per worker balances runs of different lengths
+        chunk_size = max(1, len(tasks) // (4 * workers))
+    chunks = [
+        tasks[i : i + chunk_size] for i in range(0, len(tasks), chunk_size)
+    ]
+    print(
+        f"{len(tasks)} runs in {len(chunks)} chunks on {workers} processes, "
+        f"{len(done)} already in {path}"
+    )
+
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", newline="") as stream:
+        writer = csv.writer(stream)
+        if new_file:
+            writer.writerow(header)
+            stream.flush()
+
+        n_done = 0
+        start = time.perf_counter()
+
+        def write(rows):
+            nonlocal n_done
+            writer.writerows(rows)
+            stream.flush()
+            n_done += len(rows)
+            print(
+                f"{n_done}/{len(tasks)} runs, "
+                f"{time.perf_counter() - start:.1f} s"
+            )
+
+        if workers == 1:
+            for chunk in chunks:
+                write(_run_chunk(chunk, outputs))
+        else:
+            pool = concurrent.futures.ProcessPoolExecutor(
+                workers, initializer=_init_worker
+            )
+            try:
+                futures = [
+                    pool.submit(_run_chunk, chunk, outputs) for chunk in chunks
+                ]
+                for future in concurrent.futures.as_completed(futures):
+                    write(future.result())
+            except concurrent.futures.process.BrokenProcessPool as exc:
+                raise RuntimeError(
+                    f"A worker process crashed. {n_done} of {len(tasks)} "
+                    f"runs are saved in {path}, run the sweep again to "
+                    f"continue."
+                ) from exc
+            finally:
+                # don't start the chunks that are still queued
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    return load(path)
+
+
+def load(path):
+    """
+    The table written by sweep as a dict of column name -> array, sorted by
+    index. Columns of numbers are float arrays, others string arrays.
+    """
+    with open(path, newline="") as stream:
+        reader = csv.reader(stream)
+        header = next(reader)
+        rows = sorted(reader, key=lambda row: int(row[0]))
+    table = dict()
+    for i, name in enumerate(header):
+        column = [row[i] for row in rows]
+        try:
+            table[name] = np.array(column, dtype=float)
+        except ValueError:
+            table[name] = np.array(column)
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("config", help="yaml file with a sweep section")
+    parser.add_argument("--workers", type=int, help="default: all cores")
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument("--table", help="csv file, overrides the config")
+    args = parser.parse_args(argv)
+
+    config = headless.load_config(args.config)
+    if not config.get("sweep"):
+        parser.error(f"{args.config} has no sweep section")
+    sweep(
+        config,
+        config["sweep"],
+        outputs=config.get("outputs", default_outputs),
+        path=args.table or config.get("table", "sweep.csv"),
+        workers=args.workers or config.get("workers"),
+        chunk_size=args.chunk_size or config.get("chunk_size"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a Simulator in a background thread, so rendering and physics do not
+block each other. NumPy releases the GIL in its array operations, so the
+physics keeps running while the GUI thread draws.
+"""
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+import numpy as np
+
+from profiling import PhaseTimer
+
+
+class Frame:
+    """
+    A published state of the simulation.
+    """
+
+    def __init__(self):
+        self.psi = None
+        self.t = 0.0
+        self.step = 0
+        self.energy = np.nan
+        self.steps_per_second = 0.0
+        # copy of sim.observables.history(), if observables are attached
+        self.history = None
+
+
+class SimulationWorker(threading.Thread):
+    """
+    Steps sim in batches and publishes the newest psi through a double
+    buffer. The number of steps per batch adapts so a batch takes about
+    target_time seconds, so slow steps do not freeze the renderer and fast
+    machines are not capped by the frame rate.
+
+    Hold worker.lock while changing sim from another thread. Read the newest
+    state with "with worker.frame() as frame:".
+
+    The mean time per step of every batch, including the observables
+    sampled during it, is added to timer as the "step" phase.
+
+    If stepping raises, e.g. for a method that does not support the
+    potential, the worker pauses and keeps the message in error until it is
+    played again.
+    """
+
+    def __init__(
+        self, sim, target_time=1 / 60, max_steps=100000, timer=None
+    ):
+        super().__init__(daemon=True)
+        self.sim = sim
+        self.target_time = target_time
+        self.max_steps = max_steps
+        self.steps_per_batch = 1
+        self.timer = PhaseTimer() if timer is None else timer
+
+        # held while stepping, hold it to modify sim
+        self.lock = threading.Lock()
+        self._playing = threading.Event()
+        self._stopped = threading.Event()
+        # message of the exception that paused the worker, or None
+        self.error = None
+
+        # the worker writes into _back, the renderer reads _front
+        self._front = Frame()
+        self._back = Frame()
+        self._frame_lock = threading.Lock()
+
+    def run(self):
+        while not self._stopped.is_set():
+            if not self._playing.wait(timeout=0.1) or self._stopped.is_set():
+                continue
+            with self.lock:
+                start = time.perf_counter()
+                try:
+                    self.sim.run(
+                        self.steps_per_batch, observables=(), snapshots=False
+                    )
+                except Exception as exc:
+                    traceback.print_exc()
+                    self.error = f"{type(exc).__name__}: {exc}"
+                    self.pause()
+                    continue
+                elapsed = time.perf_counter() - start
+                self.timer.add("step", elapsed, self.steps_per_batch)
+                if self.sim.observables is None:
+                    with self.timer.phase("energy"):
+                        energy = self.sim.energy()
+                else:
+                    # the energy is sampled by the attached observables
+                    energy = self.sim.observables.latest()["energy"]
+                self._publish(energy, elapsed)
+            self._adapt(elapsed)
+            # give the GUI thread a chance to take the lock
+            time.sleep(0)
+
+    def _adapt(self, elapsed):
+        """
+        Scales the batch size towards target_time, by at most a factor 2 per
+        batch to avoid oscillations.
+        """
+        factor = self.target_time / max(elapsed, 1e-9)
+        factor = min(max(factor, 0.5), 2.0)
+        steps = int(round(self.steps_per_batch * factor))
+        self.steps_per_batch = min(max(steps, 1), self.max_steps)
+
+    def _publish(self, energy, elapsed=None):
+        back = self._back
+        if back.psi is None or back.psi.shape != self.sim.psi.shape:
+            back.psi = np.empty_like(self.sim.psi)
+        np.copyto(back.psi, self.sim.psi)
+        back.t = self.sim.t
+        back.step = self.sim.step_count
+        back.energy = energy
+        if elapsed:
+            back.steps_per_second = self.steps_per_batch / elapsed
+        if self.sim.observables is not None:
+            back.history = self.sim.observables.history()
+        with self._frame_lock:
+            self._front, self._back = back, self._front
+
+    def publish(self):
+        """
+        Publishes the current state of sim, e.g. after a reset while paused.
+        """
+        with self.lock:
+            observables = self.sim.observables
+            if observables is None:
+                self._publish(self.sim.energy())
+            else:
+                observables.sample()
+                self._publish(observables.latest()["energy"])
+
+    @contextmanager
+    def frame(self):
+        """
+        The newest published Frame. Its psi is None if nothing was published
+        yet. It stays valid until the with block ends.
+        """
+        with self._frame_lock:
+            yield self._front
+
+    def play(self):
+        self.error = None
+        self._playing.set()
+
+    def pause(self):
+        self._playing.clear()
+
+    def stop(self):
+        self._stopped.set()
+        self._playing.set()